@@ -93,11 +93,28 @@ function save-logs(){
 
     # FIXME: find a better solution (solve the problem with bash file c:)
     for file in ${LOG_DIR}/* ; do 
+        # already written to EXP_LOG_DIR (see follow-logs)
+        if [ -L "$file" ] ; then
+            rm "$file"
+            continue
+        fi
         echo "copying: $file to $EXP_LOG_DIR/$NODE_ID-$(basename "$file")"
         mv "$file" "$EXP_LOG_DIR/$NODE_ID-$(basename "$file")"
     done
 }
 
+# if EXP_FOLLOW_LOGS is true, the client writes these logs straight to
+# EXP_LOG_DIR (with the names save-logs would give them), so they can be
+# followed while the experiment runs (see parser/follow.py) and are there even
+# if the node is killed before save-logs (the daemon's peers.log is left in
+# LOG_DIR, writing it to the shared directory would change the I/O of the
+# experiment)
+function follow-logs(){
+    for name in cids.log lookup-times.log publish.log ; do
+        ln -sf "$EXP_LOG_DIR/$NODE_ID-$name" "$LOG_DIR/$name"
+    done
+}
+
 # config function
 function setup-ipfs-repo(){
     # gets the repo
@@ -137,6 +154,10 @@ function main(){
 
     NODE_ID=$(ipfs id --format='<id>')
 
+    if [ "$EXP_FOLLOW_LOGS" = true ] ; then
+        follow-logs
+    fi
+
     log "Starting experiments..."
 
     # start daemon
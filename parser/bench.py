@@ -0,0 +1,245 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging as log
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pandas as pd
+
+from typing import Any, Callable, NamedTuple
+
+import charts
+import main as parser
+
+from latency import calc_lookup_sketches, calc_publish_sketches
+from summary import Summary
+from synthetic import generate_experiment
+from utils import Headers as hd
+from utils import Lookups as lk
+from utils import Snapshots as sp
+from utils import Publishes as pv
+from utils import Peers as pr
+from utils import Cids as cd
+
+# Benchmark of the parser and of the charts over synthetic experiments (see
+# synthetic.py) of increasing size. Each stage runs once, in this order, so the
+# peak RSS of a stage is the high-water mark of the process up to its end.
+
+NODES = [600, 5000, 20000]
+
+class Stage(NamedTuple):
+    nodes   : int
+    name    : str
+    seconds : float
+    rows    : int
+    rss_mb  : float  # peak RSS of the process (and of its workers) so far
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on linux
+    own      = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+class Bench:
+    def __init__(self, nodes : int):
+        self.nodes  = nodes
+        self.stages : list[Stage] = []
+
+    def run(self, name : str, func : Callable[..., Any], *args, rows : Callable[[Any], int] = len) -> Any:
+        start  = time.perf_counter()
+        result = func(*args)
+        stage  = Stage(self.nodes, name, time.perf_counter() - start, rows(result), peak_rss_mb())
+        log.info(
+            "%d nodes: %s took %.2fs (%d rows, %.0f MiB)",
+            stage.nodes, stage.name, stage.seconds, stage.rows, stage.rss_mb
+        )
+        self.stages.append(stage)
+        return result
+
+def load_nodes(dirname : str) -> parser.ExperimentIndex:
+    exp = parser.ExperimentIndex(dirname)
+    exp.load_nodes()
+    return exp
+
+def load_all_snapshots(exp : parser.ExperimentIndex) -> int:
+    return sum(
+        len(bucket)
+            for pid in exp.pids
+                for snapshot in parser.load_snapshots(f'{exp.dirname}/{pid}-peers.log')
+                    for bucket in snapshot
+    )
+
+def load_all_look_up_times(exp : parser.ExperimentIndex) -> int:
+    return sum(
+        len(parser.load_look_up_times(f'{exp.dirname}/{pid}-lookup-times.log')['cid'])
+            for pid in exp.pids
+    )
+
+def load_all_provides_records(exp : parser.ExperimentIndex) -> int:
+    return sum(
+        len(parser.load_provides_record(f'{exp.dirname}/{pid}')) for pid in exp.pids
+    )
+
+def parse_all(dirnames : list[str], jobs : int) -> parser.ExperimentTables:
+    tables = []
+    for exp_id, dirname in enumerate(dirnames):
+        exp_tables = parser.parse_files(dirname, jobs)
+        for table in exp_tables:
+            table[hd.EXP_ID] = exp_id
+        tables.append(exp_tables)
+
+    return parser.ExperimentTables(*(
+        pd.concat(list(exp_tables), ignore_index=True) for exp_tables in zip(*tables)
+    ))
+
+def summarize_all(dirnames : list[str], jobs : int) -> Summary:
+    summary = Summary()
+    for exp_id, dirname in enumerate(dirnames):
+        summary.merge(parser.summarize_files(dirname, jobs).with_exp_id(exp_id))
+    return summary
+
+def write_csv(tables : parser.ExperimentTables) -> int:
+    parser.write_table(tables.lookups,   'lookups',   lk.PID,     parser.LOOKUPS_TYPES,   'csv')
+    parser.write_table(tables.snapshots, 'snapshots', sp.SRC_PID, parser.SNAPSHOTS_TYPES, 'csv')
+    parser.write_table(tables.publishes, 'publishes', pv.SRC_PID, parser.PUBLISHES_TYPES, 'csv')
+    parser.write_table(tables.peers,     'peers',     pr.IDX,     parser.PEERS_TYPES,     'csv')
+    parser.write_table(tables.cids,      'cids',      cd.IDX,     parser.CIDS_TYPES,      'csv')
+    return sum(len(table) for table in tables)
+
+def graphs_count(graphs : charts.ExpGraphs) -> int:
+    return sum(
+        g is not None for exp_graphs in graphs.values()
+            for snaps_graphs in exp_graphs.values()
+                for g in snaps_graphs
+    )
+
+def bench_size(opts : argparse.Namespace, nodes : int, workdir : str) -> list[Stage]:
+    """
+    Generates a baseline and an upgradable experiment with `nodes` nodes
+    each and times every parser and charts stage over them (from workdir).
+    """
+    dirnames = [f'{workdir}/exp-{kind}' for kind in ['default', 'upgradable']]
+    for seed, (kind, dirname) in enumerate(zip(['default', 'upgradable'], dirnames)):
+        log.info("generating %s experiment with %d nodes", kind, nodes)
+        generate_experiment(
+            dirname, nodes, opts.cids, opts.snapshots, opts.bucket_size,
+            opts.duration, kind=kind, failed=opts.failed, seed=seed
+        )
+
+    bench = Bench(nodes)
+    os.chdir(workdir)
+
+    # the loaders (over every node of the first experiment)
+    exp = bench.run('load_nodes', load_nodes, dirnames[0], rows=len)
+    bench.run('load_snapshots',       load_all_snapshots,        exp, rows=int)
+    bench.run('load_look_up_times',   load_all_look_up_times,    exp, rows=int)
+    bench.run('load_provides_record', load_all_provides_records, exp, rows=int)
+
+    tables = bench.run('parse_files', parse_all, dirnames, opts.jobs, rows=lambda t: sum(map(len, t)))
+    bench.run('write_csv', write_csv, tables, rows=int)
+    del tables
+
+    summary = bench.run('summarize_files', summarize_all, dirnames, opts.jobs, rows=lambda s: s.total('lookups'))
+    bench.run('save_summary', summary.save, 'summary.json', rows=lambda _: len(summary))
+
+    if opts.no_charts:
+        return bench.stages
+
+    charts.__init__()
+    charts.GRAPH_SAMPLES = opts.graph_samples
+
+    lookups   = bench.run('read_data(lookups)',   charts.read_data, 'lookups.csv')
+    snapshots = bench.run('read_data(snapshots)', charts.read_data, 'snapshots.csv')
+    publishes = bench.run('read_data(publishes)', charts.read_data, 'publishes.csv')
+
+    rt_cube     = bench.run('calc_rt_cube', charts.calc_rt_cube, snapshots)
+    composition = bench.run('calc_rt_composition', charts.calc_rt_composition, rt_cube)
+
+    graphs  = bench.run('build_graphs', charts.build_graphs, snapshots, rows=graphs_count)
+    metrics = bench.run(
+        'calc_graph_metrics', charts.calc_graph_metrics, graphs, charts.graph_metrics_names(), opts.jobs, None
+    )
+
+    lookup_sketches  = bench.run('calc_lookup_sketches',  calc_lookup_sketches,  lookups)
+    publish_sketches = bench.run('calc_publish_sketches', calc_publish_sketches, publishes)
+
+    tables = {
+        'lookups' : lookups, 'snapshots' : snapshots, 'publishes' : publishes,
+        'rt_composition' : composition, 'metrics' : metrics,
+        'lookup_sketches' : lookup_sketches, 'publish_sketches' : publish_sketches
+    }
+    for name, chart in charts.CHARTS.items():
+        table = tables[chart.data]
+        data  = bench.run(f'calc {name}', chart.calc, table, rows=lambda _, table=table: len(table))
+        bench.run(f'plot {name}', chart.plot, data, rows=lambda _, table=table: len(table))
+
+    if opts.jobs > 1:
+        # every chart again, drawn by a pool of processes
+        data = charts.ChartsData(charts.graph_metrics_names(), opts.jobs)
+        for name, table in tables.items():
+            setattr(data, name, table)
+        selected = list(charts.CHARTS.values())
+        bench.run('draw_charts', charts.draw_charts, data, selected, opts.jobs, rows=lambda _: len(selected))
+
+    return bench.stages
+
+def report(stages : list[Stage]) -> pd.DataFrame:
+    data = pd.DataFrame(stages, columns=list(Stage._fields))
+    data['rows/s'] = (data['rows'] / data['seconds']).round()
+    return data
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Times the parser and the charts over synthetic experiments.'
+    )
+    parser.add_argument(
+        '-n', '--nodes', type=int, nargs='+', default=NODES,
+        help=f'number of nodes of each benchmarked size (default: {" ".join(map(str, NODES))})'
+    )
+    parser.add_argument('-c', '--cids', type=int, default=20, help='cids per node (default: 20)')
+    parser.add_argument('-s', '--snapshots', type=int, default=40, help='snapshots per node (default: 40)')
+    parser.add_argument('-b', '--bucket-size', type=int, default=10, help='(default: 10)')
+    parser.add_argument('-d', '--duration', type=int, default=30 * 60, help='in seconds (default: 1800)')
+    parser.add_argument('-f', '--failed', type=float, default=0.0, help='fraction of failed nodes (default: 0)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='processes of the parser, graph metrics and charts (default: 1)')
+    parser.add_argument(
+        '--graph-samples', type=int, default=32,
+        help='sampled nodes of the diameter and path length estimates, 0 for the exact ones (default: 32)'
+    )
+    parser.add_argument('--no-charts', action='store_true', help='only benchmark the parser')
+    parser.add_argument('--keep', metavar='DIR', help='generate (and keep) the experiments in DIR')
+    parser.add_argument('-o', '--output', metavar='FILE', help='also save the results to a csv file')
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    opts = parse_args(args)
+    log.basicConfig(level=log.INFO, format="%(levelname)s: %(message)s")
+
+    cwd    = os.getcwd()
+    output = os.path.abspath(opts.output) if opts.output else None
+    stages = []
+    for nodes in opts.nodes:
+        if opts.keep:
+            workdir = os.path.abspath(f'{opts.keep}/{nodes}-nodes')
+            os.makedirs(workdir, exist_ok=True)
+            stages += bench_size(opts, nodes, workdir)
+        else:
+            with tempfile.TemporaryDirectory(prefix='ipfs-tests-bench-') as workdir:
+                stages += bench_size(opts, nodes, workdir)
+                os.chdir(cwd)
+
+    os.chdir(cwd)
+    results = report(stages)
+    print(results.to_string(index=False))
+    if output is not None:
+        results.to_csv(output, index=False)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,60 @@
+import hashlib
+import logging as log
+import os
+import pickle
+
+from typing import Any
+
+# bump it whenever the parsed tables change (it invalidates every cache entry)
+CACHE_VERSION = 4
+
+CACHE_DIR = '.parse-cache'
+
+def dir_signature(dirname : str) -> str:
+    """
+    Hash of the name, size and modification time of every file in the
+    experiment directory, or of the experiment archive (and of CACHE_VERSION).
+    """
+    sign = hashlib.sha1(f'version:{CACHE_VERSION}'.encode())
+    if os.path.isfile(dirname):
+        files = [(os.path.basename(dirname), os.stat(dirname))]
+    else:
+        with os.scandir(dirname) as entries:
+            files = sorted(
+                (entry.name, entry.stat()) for entry in entries if entry.is_file()
+            )
+
+    for name, stat in files:
+        sign.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+
+    return sign.hexdigest()
+
+def cache_file(cache_dir : str, dirname : str) -> str:
+    name = hashlib.sha1(os.path.abspath(dirname).encode()).hexdigest()
+    return f'{cache_dir}/{name}.pkl'
+
+def load_cached(cache_dir : str, dirname : str, signature : str) -> Any | None:
+    filename = cache_file(cache_dir, dirname)
+    try:
+        with open(filename, 'rb') as file:
+            entry = pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if entry['signature'] != signature:
+        log.info("cache of %s is outdated", dirname)
+        return None
+
+    log.info("loaded %s from cache (%s)", dirname, filename)
+    return entry['data']
+
+def save_cached(cache_dir : str, dirname : str, signature : str, data : Any):
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = cache_file(cache_dir, dirname)
+    entry    = {'signature' : signature, 'data' : data}
+
+    # written to a temporary file first so that an interrupted run never
+    # leaves a broken entry behind
+    with open(f'{filename}.tmp', 'wb') as file:
+        pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{filename}.tmp', filename)
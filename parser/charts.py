@@ -2,23 +2,52 @@
 
 from csv import writer
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
+import argparse
 import math
 import sys
 
 from utils import Lookups as lk
 from utils import Snapshots as sp 
 from utils import Publishes as pb
-from typing import cast, Callable
+from utils import GraphMetrics as gm
+from utils import RtCube as rc
+import profiling
+from rt_cube import calc_rt_cube
+from time_series import calc_time_series, pivot_time_series, percentile_column
+from latency import Sketches, calc_lookup_sketches, calc_publish_sketches, merge_sketches, regroup_sketches, calc_latency_quantiles, LOOKUP_KEYS, PUBLISH_KEYS
+from sketch import DDSketch
+from graph_metrics import ExpGraphs, calc_graph_metrics, approx_metrics, APPROX_METRICS
+from functools import cached_property
+from typing import cast, Any, Callable, NamedTuple
 from igraph import Graph
+from matplotlib.figure import Figure
+from matplotlib.axes import Axes
+from matplotlib.artist import setp
+from concurrent.futures import ProcessPoolExecutor
 from os import path, mkdir
-
-type ExpGraphs = dict[str, list[list[Graph]]]
+from glob import glob
 
 BARS_COLORS     = ['C10', 'C9', 'C1', 'C2']
 CHARTS_SAVE_DIR = 'charts'
+# number of sampled nodes used to estimate the diameter and the average path
+# length of the graphs (0 means the exact ones, which are too slow for very
+# large graphs)
+GRAPH_SAMPLES   = 0
+# width (in seconds) of the time bins of the throughput charts and the
+# percentiles of the latency shown for each one
+THROUGHPUT_BIN  = 60
+LATENCY_PERCENTILES = [50, 90, 99]
+# percentiles of the latency distribution charts and the number of bins of
+# their histograms for each power of 10
+LATENCY_QUANTILES       = [0.5, 0.9, 0.99, 0.999]
+LATENCY_BINS_PER_DECADE = 20
+DHT_NAMES       = {
+    'DEFAULT' : 'Baseline',
+    'SECURE'  : 'Secure',
+    'NORMAL'  : 'Normal'
+}
 
 def __init__():
     if not path.exists(CHARTS_SAVE_DIR):
@@ -30,57 +59,75 @@ def __init__():
         )
         sys.exit(1)
 
-def save_fig(filename: str, fig : plt.Figure = None): # type: ignore
-    # TODO: check if directory charts exists, if not created it :)
-    fig = fig if fig is not None else plt  # type: ignore
-    filename = f'charts/{filename}'
+def save_fig(filename: str, fig : Figure):
+    filename = f'{CHARTS_SAVE_DIR}/{filename}'
     print(f"Saving '{filename}'")
     fig.savefig(filename)
-    plt.clf()  # clear drawn charts for others :) # TODO: get rid of this thing c:
 
+def center_xticks(ax : Axes):
+    setp(ax.get_xticklabels(), rotation=0, horizontalalignment="center")
 
-def plot_avg_success_resolve(data: pd.DataFrame):
-    data = data[data[lk.PROVIDERS] > 0] # type: ignore
 
-    data = data.groupby([lk.PEER_DHT, lk.CID_TYPE])[lk.LOOKUP_TIME].agg(resolve_time='mean') # type: ignore
+# the bars charts of the look-ups and publishes are calculated from the
+# counters and sums of each group (their totals), which are added up one
+# table partition at a time, so the tables are never loaded as a whole
 
-    # print(data)
-    data.reset_index(level=(lk.CID_TYPE,), inplace=True)
-    pivot_data = data.pivot(columns=lk.CID_TYPE, values='resolve_time').fillna(0)
+LOOKUP_GROUPS = [lk.PEER_DHT, lk.CID_TYPE]
 
-    ax = pivot_data.plot(
+@profiling.stage
+def calc_lookup_totals(data: pd.DataFrame) -> pd.DataFrame:
+    resolved = data[lk.PROVIDERS] > 0
+    data = data[LOOKUP_GROUPS].assign(
+        lookups=1,
+        providers=data[lk.PROVIDERS],
+        resolved=resolved.astype(np.int64),
+        resolve_time=data[lk.LOOKUP_TIME].where(resolved, 0.0),
+        resolve_queries=data[lk.QUERIES].where(resolved, 0),
+    )
+    return data.groupby(LOOKUP_GROUPS, observed=True).sum().reset_index()
+
+def sum_totals(totals : pd.DataFrame, by : list[str]) -> pd.DataFrame:
+    """ The totals of several partitions added up. """
+    return totals.groupby(by, observed=True).sum().reset_index()
+
+@profiling.stage
+def calc_avg_success_resolve(totals: pd.DataFrame) -> pd.DataFrame:
+    data = totals[totals['resolved'] > 0]
+    data = data.assign(resolve_time=data['resolve_time'] / data['resolved'])
+    return data.pivot(index=lk.PEER_DHT, columns=lk.CID_TYPE, values='resolve_time').fillna(0)
+
+@profiling.stage
+def plot_avg_success_resolve(pivot_data: pd.DataFrame):
+    fig = Figure(figsize=(14, 6))
+    ax  = pivot_data.plot(
         kind='bar', color=BARS_COLORS[1:],
-        figsize=(14, 6),
+        ax=fig.subplots(),
     )
 
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[round(v, 2) if v > 0.0 else '' for v in cnt.datavalues])
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.ylabel('time (ms)', fontweight='bold')
-    plt.title('Average Resolve time (ms)', fontweight='bold')
-    plt.legend(title='CID types')
-
-    # plt.show()
-    save_fig('avg-resolve.pdf')
-
-
-def plot_success_rate(data: pd.DataFrame):
+    center_xticks(ax)
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.set_ylabel('time (ms)', fontweight='bold')
+    ax.set_title('Average Resolve time (ms)', fontweight='bold')
+    ax.legend(title='CID types')
 
-    data = data.groupby([lk.PEER_DHT, lk.CID_TYPE])[lk.PROVIDERS].aggregate(
-        ['sum', 'count']
-    ) # type: ignore
-    data.reset_index(level=(lk.CID_TYPE,), inplace=True)
+    save_fig('avg-resolve.pdf', fig)
 
-    data['success rate'] = data['sum'] / data['count'] * 100
 
-    pivot_data = data.pivot(columns=lk.CID_TYPE, values='success rate').fillna(0)
+@profiling.stage
+def calc_success_rate(totals: pd.DataFrame) -> pd.DataFrame:
+    data = totals.assign(**{'success rate' : totals['providers'] / totals['lookups'] * 100})
+    return data.pivot(index=lk.PEER_DHT, columns=lk.CID_TYPE, values='success rate').fillna(0)
 
-    ax = pivot_data.plot(
+@profiling.stage
+def plot_success_rate(pivot_data: pd.DataFrame):
+    fig = Figure(figsize=(14, 6))
+    ax  = pivot_data.plot(
         kind='bar',
-        figsize=(14, 6),
         color=BARS_COLORS[1:],
+        ax=fig.subplots(),
     )
 
     # print(pivot_data)
@@ -88,123 +135,112 @@ def plot_success_rate(data: pd.DataFrame):
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[round(v, 2) if v > 0.0 else '' for v in cnt.datavalues])
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.ylabel('success rate (%)', fontweight='bold')
-    plt.title('Success rate of resolved CIDs', fontweight='bold')
-    plt.legend(title='CID types', loc='lower right')
+    center_xticks(ax)
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.set_ylabel('success rate (%)', fontweight='bold')
+    ax.set_title('Success rate of resolved CIDs', fontweight='bold')
+    ax.legend(title='CID types', loc='lower right')
 
-    # # Display the histogram
-    # plt.show()
-    save_fig('success-rate.pdf')
+    save_fig('success-rate.pdf', fig)
 
 
-# turn this into an average per node :) 
-def plot_cids_lookups(data: pd.DataFrame):
+# turn this into an average per node :)
+@profiling.stage
+def calc_cids_lookups(totals: pd.DataFrame) -> pd.DataFrame:
     # TODO: think if it's worthed to set constants
     # TODO: think on a way to solve the colors incovinience
-    # total_resolves = len(data)
-    # print(total_resolves)
-    # print('-----------------------')
-    # print(data)
-    data = data.groupby(lk.PEER_DHT)[lk.CID_TYPE].value_counts().to_frame()
-    # print('-----------------------')
-    # print(data)
-    data.reset_index(level=(lk.CID_TYPE,), inplace=True)
-
-    pivot_data = data.pivot(columns=lk.CID_TYPE, values='count').fillna(0)
-    # print(pivot_data)
-    # for col in pivot_data:
-    #     pivot_data[col] = (100 * pivot_data[col] / total_resolves) 
-
-    # print('-----------------------')
-    # print(pivot_data)
-    __before = pivot_data['Normal']
-
-    pivot_data['Normal'] = pivot_data['Secure'] + pivot_data['Normal']
-
-    ax = None
-    for col, color in zip(pivot_data, BARS_COLORS[1:]):
-        tmp = pivot_data.plot(
+    return totals.pivot(index=lk.PEER_DHT, columns=lk.CID_TYPE, values='lookups').fillna(0)
+
+@profiling.stage
+def plot_cids_lookups(pivot_data: pd.DataFrame):
+    # the Normal bars are stacked on top of the Secure ones
+    stacked = pivot_data.copy()
+    stacked['Normal'] = pivot_data['Secure'] + pivot_data['Normal']
+
+    fig = Figure(figsize=(12, 8))
+    ax  = fig.subplots()
+    for col, color in zip(stacked, BARS_COLORS[1:]):
+        stacked.plot(
             kind='bar',
             color=color,
-            figsize=(12, 8),
             y=col,
             ax=ax
         )
-        if ax is None:
-            ax = tmp
-
-    # fix what I did :)
-    pivot_data['Normal'] = pivot_data['Normal'] - pivot_data['Secure']
-
-    assert (__before == pivot_data['Normal']).all(
-    ), 'Normal data not properly restored'
 
     for cont, col in zip(ax.containers, pivot_data):
         ax.bar_label(cont, labels=['{:,}'.format(
             int(x)) if x != 0.0 else '' for x in pivot_data[col]])
-            # round(x, 2)) if x != 0.0 else '' for x in pivot_data[col]])
 
     ax.legend(title='CID types')
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.ylabel('Number of CIDs lookups', fontweight='bold')
-    plt.xlabel('DHT Types', fontweight='bold')
-    plt.title('Number of CIDs lookups by DHT and CID type', fontweight='bold')
-
-    # plt.show()
-    save_fig('lookup-hist.pdf')
-
-def calc_rt_evolution(snapshots: pd.DataFrame, fig : plt.Figure | None = None) -> pd.DataFrame:
-    data = snapshots.groupby([sp.SRC_PID, sp.SNAPSHOT_NR, sp.SRC_DHT, sp.EXP_ID])[sp.DST_DHT].value_counts().to_frame()
-    # print(data)
-
-    # get each type as a row
-    data.reset_index(level=(sp.DST_DHT), inplace=True)
-    pivot_data = data.pivot(columns=sp.DST_DHT, values='count').fillna(0)
-    # print(pivot_data)
-
-    # turn each row number as  (axis=1 stands for apply to each row)
-    pivot_data = pivot_data.apply(lambda x: round(x / x.sum() * 100, 2), axis=1)
-    pivot_data.reset_index(inplace=True)
-    
-    pivot_data.drop(columns=[sp.SRC_DHT, sp.SRC_PID, sp.EXP_ID], inplace=True)
-    pivot_data = pivot_data.groupby(sp.SNAPSHOT_NR).mean()
-    # print(pivot_data)
-
-    fig = fig if fig is not None else plt
-    for dht_type in pivot_data.columns:
-        aux = pivot_data[dht_type]
-        if len(aux) > 0 :
-            fig.plot(pivot_data.index, aux, label=dht_type)
-
-    return pivot_data
+    center_xticks(ax)
+    ax.set_ylabel('Number of CIDs lookups', fontweight='bold')
+    ax.set_xlabel('DHT Types', fontweight='bold')
+    ax.set_title('Number of CIDs lookups by DHT and CID type', fontweight='bold')
+
+    save_fig('lookup-hist.pdf', fig)
+
+
+# bucket number of the whole routing table rows of the composition
+WHOLE_RT = -1
+
+@profiling.stage
+def calc_rt_composition(rt_cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    Percentage (rounded to 2 decimals) of each dht version among the peers of
+    every routing table (src-dht, exp-id, src-pid, snapshot-nr) bucket and of
+    the whole table (bucket-nr WHOLE_RT), with a column for each version.
+    """
+    counts = rt_cube.groupby(
+        [rc.SRC_DHT, rc.EXP_ID, rc.SRC_PID, rc.SNAPSHOT_NR, rc.BUCKET_NR, rc.DST_DHT], observed=True
+    )[rc.COUNT].sum().unstack(rc.DST_DHT, fill_value=0)
+
+    whole = counts.groupby(
+        level=[sp.SRC_DHT, sp.EXP_ID, sp.SRC_PID, sp.SNAPSHOT_NR], observed=True
+    ).sum()
+    whole[sp.BUCKET_NR] = WHOLE_RT
+    whole = whole.set_index(sp.BUCKET_NR, append=True)
+
+    counts = pd.concat([whole, counts])
+    return (counts.div(counts.sum(axis=1), axis=0) * 100).round(2)
+
+def rt_composition_slice(composition: pd.DataFrame, src_dhts: list[str], bucket: int) -> pd.DataFrame:
+    rows = composition[
+          composition.index.get_level_values(sp.SRC_DHT).isin(src_dhts)
+        & (composition.index.get_level_values(sp.BUCKET_NR) == bucket)
+    ]
+    # only the versions found in these routing tables
+    return rows.loc[:, (rows > 0).any()]
 
+@profiling.stage
+def calc_rt_evolution(composition: pd.DataFrame, node_type: str, bucket: int) -> pd.DataFrame:
+    rows = rt_composition_slice(composition, [node_type], bucket)
+    return rows.groupby(level=sp.SNAPSHOT_NR).mean()
 
-def plot_rt_evolution(snapshots: pd.DataFrame):
+# node type -> evolution of the whole routing table (bucket WHOLE_RT) and of each bucket
+type RtEvolution = dict[str, list[tuple[int, pd.DataFrame]]]
 
+@profiling.stage
+def calc_rt_buckets_evolution(composition: pd.DataFrame) -> RtEvolution:
+    src_dhts = composition.index.get_level_values(sp.SRC_DHT)
+    evolution = {}
     for node_type in ['Secure', 'Normal']:
-        snaps    = snapshots[snapshots[sp.SRC_DHT] == node_type]
-        # print(node_type)
+        buckets = composition[src_dhts == node_type].index.unique(sp.BUCKET_NR)
+        evolution[node_type] = [
+            (bucket, calc_rt_evolution(composition, node_type, bucket)) for bucket in sorted(buckets)
+        ]
+    return evolution
 
-        buckets = snaps[sp.BUCKET_NR].unique()
+@profiling.stage
+def plot_rt_evolution(evolution: RtEvolution):
 
+    for node_type, buckets in evolution.items():
         cols = 3
         rows = int(math.ceil(
-            (len(buckets) + 1)/ cols
+            len(buckets) / cols
         ))
 
-        fig, axes = plt.subplots(
-            nrows=rows, ncols=cols, figsize=(25,20), layout='constrained', sharey=True
-        )
-
-        over_all = axes[0, 0]
-        dht_evol = calc_rt_evolution(snaps, over_all)
-
-        over_all.set_title(f'Whole Routing Table', fontweight='bold')
-        over_all.set_ylim(0, 100)
-        over_all.set_xlim(0, dht_evol.index.max()) # 0 to max snapshot-number
-        over_all.legend(fontsize=12)
+        fig  = Figure(figsize=(25,20), layout='constrained')
+        axes = fig.subplots(nrows=rows, ncols=cols, sharey=True, squeeze=False)
 
         fig.suptitle(
             'Routing table evoluation for Secure Nodes', fontweight='bold', fontsize=20
@@ -218,55 +254,57 @@ def plot_rt_evolution(snapshots: pd.DataFrame):
             'Percentage (%) of nodes in the bucket', fontweight='bold', fontsize=16
         )
 
-        for bucket in buckets:
+        for bucket, data in buckets:
             row = (bucket + 1) // cols
             col = (bucket + 1) % cols
 
-            ax   = axes[row, col]
-            data = calc_rt_evolution(snaps[ snaps[sp.BUCKET_NR] == bucket ], fig=ax)
+            ax = axes[row, col]
+            for dht_type in data.columns:
+                aux = data[dht_type]
+                if len(aux) > 0 :
+                    ax.plot(data.index, aux, label=dht_type)
 
             # ...
-            ax.set_title(f'Bucket {bucket}', fontweight='bold')
+            ax.set_title(
+                'Whole Routing Table' if bucket == WHOLE_RT else f'Bucket {bucket}', fontweight='bold'
+            )
             ax.set_ylim(0, 100)
             ax.set_xlim(0, data.index.max()) # 0 to max snapshot-number
             ax.legend(fontsize=12)
 
         # save_fig(f'{node_type}-rt-evol-bucket-{bucket}.pdf')
-        save_fig(f'{node_type}-rt-buckets-evol.pdf', fig=fig)
-
-
+        save_fig(f'{node_type}-rt-buckets-evol.pdf', fig)
 
-def calc_rt_state(snapshots: pd.DataFrame) -> pd.DataFrame:
-    data = snapshots.groupby([
-        sp.SRC_PID, sp.SNAPSHOT_NR, sp.SRC_DHT, sp.EXP_ID
-    ])[sp.DST_DHT].value_counts().to_frame('version-frequency')
 
-    data.reset_index(level=(sp.DST_DHT), inplace=True)
 
-    # get each type as a row turn each dht version type number into a row
-    pivot_data = data.pivot(columns=sp.DST_DHT, values='version-frequency').fillna(0)
-
-    # calculate the percentage of each freuqency
-    pivot_data = pivot_data.apply(lambda x: round(x / x.sum() * 100, 2), axis=1)
-    pivot_data.reset_index(inplace=True)
-    
-    # drop the collumns that doesn't matter more
-    pivot_data.drop(columns=[sp.SRC_PID, sp.EXP_ID, sp.SNAPSHOT_NR], inplace=True)
+@profiling.stage
+def calc_rt_state(composition: pd.DataFrame, snapshot: int, bucket: int) -> pd.DataFrame:
+    rows = rt_composition_slice(composition, ['Secure', 'Normal'], bucket)
+    rows = rows[rows.index.get_level_values(sp.SNAPSHOT_NR) == snapshot]
 
     # get the average of each percentage by SRC_DHT
-    pivot_data = pivot_data.groupby(sp.SRC_DHT).mean()
+    return rows.loc[:, (rows > 0).any()].groupby(level=sp.SRC_DHT, observed=True).mean()
+
+# state of the whole routing table (bucket WHOLE_RT) and of each bucket
+type RtState = list[tuple[int, pd.DataFrame]]
 
-    
-    return pivot_data
+@profiling.stage
+def calc_end_rt_state(composition: pd.DataFrame) -> RtState:
+    snapshots = composition.index.get_level_values(sp.SNAPSHOT_NR)
+    last_snap = snapshots.max()
 
-def plot_end_rt_state(snapshots: pd.DataFrame):
-    last_snap = snapshots[sp.SNAPSHOT_NR].unique().max()
-    snapshots = snapshots[ 
-          (snapshots[sp.SNAPSHOT_NR] == last_snap - 1) 
-        & (snapshots[sp.SRC_DHT].isin(['Secure', 'Normal']))
+    end_state = composition[
+          (snapshots == last_snap - 1)
+        & composition.index.get_level_values(sp.SRC_DHT).isin(['Secure', 'Normal'])
+    ]
+    return [
+        (bucket, calc_rt_state(end_state, last_snap - 1, bucket))
+            for bucket in sorted(end_state.index.unique(sp.BUCKET_NR))
     ]
 
-    def built_chart(data: pd.DataFrame, title: str, ax : plt.Figure):
+@profiling.stage
+def plot_end_rt_state(state: RtState):
+    def built_chart(data: pd.DataFrame, title: str, ax : Axes):
         # sns.heatmap(
         #     data, annot=True, cmap='Blues', ax=ax, fmt='.2f', annot_kws={"fontsize": 10}
         # )
@@ -290,23 +328,18 @@ def plot_end_rt_state(snapshots: pd.DataFrame):
         ticks  = range(len(labels))
         ax.set_xticks( # type: ignore
            ticks,
-           labels=labels, 
-           rotation=0, 
+           labels=labels,
+           rotation=0,
            horizontalalignment="center"
-        ) 
+        )
 
-    all_buckets = snapshots[sp.BUCKET_NR].unique()
     rows = 3
-    cols = int(math.ceil( 
-        # (len(all_buckets) + 1)/ 2
-        ( len(all_buckets) + 1) / rows
+    cols = int(math.ceil(
+        len(state) / rows
     ))
 
-    # data = calc_rt_state(snapshots)
-    # built_chart(data, 'Percentage of nodes neibours in the Routing table', 'rt-end-state.pdf')
-    fig, axes = plt.subplots(
-        nrows=rows, ncols=cols, figsize=(25, 20), layout='constrained'
-    )
+    fig  = Figure(figsize=(25, 20), layout='constrained')
+    axes = fig.subplots(nrows=rows, ncols=cols, squeeze=False)
 
     fig.suptitle(
         'Routing table end state for Secure and Normal Nodes', fontweight='bold', fontsize=20
@@ -320,272 +353,420 @@ def plot_end_rt_state(snapshots: pd.DataFrame):
         'Percentage (%) of nodes in the routing table', fontweight='bold', fontsize=16
     )
 
-    data = calc_rt_state(snapshots)
-    built_chart(
-        data, 
-        'Whole Routing Table', 
-        axes[0, 0]
-    )
-
-    # for bucket in snapshots[sp.BUCKET_NR].unique():
-    for bucket in all_buckets:
+    for bucket, data in state:
         col = (bucket + 1) % cols
         row = (bucket + 1) // cols
 
-        snaps = snapshots[snapshots[sp.BUCKET_NR] == bucket]
-        data  = calc_rt_state(snaps) # type: ignore
         built_chart(
-            data, 
-            f'Bucket {bucket}', 
+            data,
+            'Whole Routing Table' if bucket == WHOLE_RT else f'Bucket {bucket}',
             ax=axes[row, col]
         )
 
     # TODO: uncomment when needed
-    # blank_spots = cols * rows - len(all_buckets)
+    # blank_spots = cols * rows - len(state)
     # if blank_spots > 0:
     #     for i in range(blank_spots):
     #         axes[ rows - 1, cols - (1 + i)].axis('off')
-    save_fig('rt-end-state.pdf', fig=fig)
+    save_fig('rt-end-state.pdf', fig)
 
 
-def plot_avg_resolve_queries(data: pd.DataFrame):
-    data = data[
-        data[lk.PROVIDERS] > 0
-    ].groupby([lk.PEER_DHT, lk.CID_TYPE])[lk.QUERIES].mean().to_frame('avg-res-queries')
+@profiling.stage
+def calc_avg_resolve_queries(totals: pd.DataFrame) -> pd.DataFrame:
+    data = totals[totals['resolved'] > 0]
+    data = data.assign(**{'avg-res-queries' : data['resolve_queries'] / data['resolved']})
+    return data.pivot(index=lk.PEER_DHT, columns=lk.CID_TYPE, values='avg-res-queries').fillna(0)
 
-    data.reset_index(level=(lk.CID_TYPE,), inplace=True)
-
-    pivot_data = data.pivot(columns=lk.CID_TYPE, values='avg-res-queries').fillna(0)
-
-    ax = pivot_data.plot(
+@profiling.stage
+def plot_avg_resolve_queries(pivot_data: pd.DataFrame):
+    fig = Figure(figsize=(12, 6))
+    ax  = pivot_data.plot(
         kind='bar',
-        figsize=(12, 6),
         color=BARS_COLORS[1:],
+        ax=fig.subplots(),
     )
 
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[f"{round(v, 1)}" if v > 0.0 else '' for v in cnt.datavalues])
 
-    # print(pivot_data)
+    center_xticks(ax)
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.legend(title='CID Types', loc='lower right')
+    ax.set_ylabel('Number of queries', fontweight='bold')
+    ax.set_title('Average number of queries per resolved CID type', fontweight='bold')
+    save_fig('avg-res-queries.pdf', fig)
+
+class PublishTotals(NamedTuple):
+    publishes : pd.DataFrame # by source DHT: the time, queries and storage nodes of the publishes
+    nodes     : pd.DataFrame # by source and storage DHT: the number of storage nodes
+
+@profiling.stage
+def calc_publish_totals(data: pd.DataFrame) -> PublishTotals:
+    def sum_count(column : str) -> pd.DataFrame:
+        # one row per publish (the table has one per storage node)
+        values = data[[pb.SRC_PID, pb.SRC_DHT, pb.EXP_ID, pb.CID, column]].drop_duplicates()
+        return values.groupby(pb.SRC_DHT, observed=True)[column].agg(['sum', 'count']).add_prefix(f'{column} ')
+
+    stored = data.dropna(subset=[pb.STORAGE_DHT])
+    publishes = pd.concat([
+        sum_count(pb.DURATION),
+        sum_count(pb.QUERIES_NR),
+        stored.drop_duplicates([pb.EXP_ID, pb.SRC_PID, pb.SRC_DHT, pb.CID]).groupby(
+            pb.SRC_DHT, observed=True
+        ).size().rename('stored'),
+    ], axis=1).fillna(0)
+    nodes = stored.groupby([pb.SRC_DHT, pb.STORAGE_DHT], observed=True).size().rename('count')
+    return PublishTotals(publishes.reset_index(), nodes.reset_index())
+
+def merge_publish_totals(all_totals : list[PublishTotals]) -> PublishTotals:
+    return PublishTotals(
+        sum_totals(pd.concat([totals.publishes for totals in all_totals], ignore_index=True), [pb.SRC_DHT]),
+        sum_totals(pd.concat([totals.nodes for totals in all_totals], ignore_index=True), [pb.SRC_DHT, pb.STORAGE_DHT]),
+    )
+
+@profiling.stage
+def calc_publish_time(totals: PublishTotals) -> pd.Series:
+    data = totals.publishes.set_index(pb.SRC_DHT)
+    data = data[data[f'{pb.DURATION} count'] > 0]
+    return (data[f'{pb.DURATION} sum'] / data[f'{pb.DURATION} count']).rename(pb.DURATION)
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.legend(title='CID Types', loc='lower right')
-    plt.ylabel('Number of queries', fontweight='bold')
-    plt.title('Average number of queries per resolved CID type', fontweight='bold')
-    # plt.show()
-    save_fig('avg-res-queries.pdf')
-
-def plot_puslibh_time(data: pd.DataFrame):
-    data = data[[
-        pb.SRC_PID, pb.SRC_DHT, pb.EXP_ID, pb.CID, pb.DURATION
-    ]].drop_duplicates() # type: ignore
-    
-    ax = data.groupby(pb.SRC_DHT)[pb.DURATION].mean().plot(
+@profiling.stage
+def plot_publish_time(data: pd.Series):
+    fig = Figure(figsize=(12, 6))
+    ax  = data.plot(
         kind='bar',
-        figsize=(12, 6),
         color=BARS_COLORS[1:],
+        ax=fig.subplots(),
     )
 
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[round(v, 2) if v > 0.0 else '' for v in cnt.datavalues])
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.ylabel('time (ms)', fontweight='bold')
-    plt.title('Average publish time (ms)', fontweight='bold')
-    # plt.show()
-    save_fig('avg-publish-time.pdf')
-
-def plot_publish_queries(data: pd.DataFrame):
-    
-    data = data[[
-        pb.SRC_PID, pb.SRC_DHT, pb.EXP_ID, pb.CID, pb.QUERIES_NR
-    ]].drop_duplicates() # type: ignore
-
-    ax = data.groupby(pb.SRC_DHT)[pb.QUERIES_NR].mean().plot(
+    center_xticks(ax)
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.set_ylabel('time (ms)', fontweight='bold')
+    ax.set_title('Average publish time (ms)', fontweight='bold')
+    save_fig('avg-publish-time.pdf', fig)
+
+@profiling.stage
+def calc_publish_queries(totals: PublishTotals) -> pd.Series:
+    data = totals.publishes.set_index(pb.SRC_DHT)
+    data = data[data[f'{pb.QUERIES_NR} count'] > 0]
+    return (data[f'{pb.QUERIES_NR} sum'] / data[f'{pb.QUERIES_NR} count']).rename(pb.QUERIES_NR)
+
+@profiling.stage
+def plot_publish_queries(data: pd.Series):
+    fig = Figure(figsize=(12, 6))
+    ax  = data.plot(
         kind='bar',
-        figsize=(12, 6),
         color=BARS_COLORS[1:],
+        ax=fig.subplots(),
     )
 
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[round(v, 1) if v > 0.0 else '' for v in cnt.datavalues])
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.ylabel('Average number of queries', fontweight='bold')
-    plt.title('Average number of queries per published CID', fontweight='bold')
-    # plt.show()
-    save_fig('avg-publish-queries.pdf')
-
-def plot_publish_nodes(data: pd.DataFrame):
-    data = data.groupby([
-        pb.EXP_ID, pb.SRC_PID, pb.SRC_DHT, pb.CID
-    ])[pb.STORAGE_DHT].value_counts().to_frame('count')
-
-    data.reset_index(level=(pb.STORAGE_DHT), inplace=True)
+    center_xticks(ax)
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.set_ylabel('Average number of queries', fontweight='bold')
+    ax.set_title('Average number of queries per published CID', fontweight='bold')
+    save_fig('avg-publish-queries.pdf', fig)
 
-    pivot = data.pivot(columns=pb.STORAGE_DHT, values='count').fillna(0)
-    pivot.reset_index(inplace=True)
-    pivot.drop(columns=[pb.SRC_PID, pb.EXP_ID, pb.CID], inplace=True)
+@profiling.stage
+def calc_publish_nodes(totals: PublishTotals) -> pd.DataFrame:
+    # average over the publishes with storage nodes
+    nodes  = totals.nodes.pivot(index=pb.SRC_DHT, columns=pb.STORAGE_DHT, values='count').fillna(0)
+    stored = totals.publishes.set_index(pb.SRC_DHT)['stored']
+    return nodes.div(stored.reindex(nodes.index), axis=0)
 
-    ax = pivot.groupby(pb.SRC_DHT).mean().plot(
+@profiling.stage
+def plot_publish_nodes(data: pd.DataFrame):
+    fig = Figure(figsize=(12, 6))
+    ax  = data.plot(
         kind='bar',
         color=BARS_COLORS[1:],
-        figsize=(12, 6),
+        ax=fig.subplots(),
     )
 
     for cnt in ax.containers:
         ax.bar_label(cnt, labels=[round(v, 1) if v > 0.0 else '' for v in cnt.datavalues])
 
-    plt.xticks(rotation=0, horizontalalignment="center")
-    plt.legend(title='Storage Nodes DHT')
-    plt.title('Average number of nodes published per CID', fontweight='bold')
-    plt.xlabel('DHT version', fontweight='bold')
-    plt.ylabel('Average number of nodes', fontweight='bold')
-    # plt.show()
-    save_fig('avg-published-nodes.pdf')
-
-def plot_throughput(data: pd.DataFrame):
-    lookups = data.copy()
-
-    for name in ['Secure', 'Normal']:
-        lookups.replace(name, 'Normal vs Secure', inplace=True)
-
-    lookups[lk.TS]    = (lookups[lk.TS] / 60).round(0) # convert to seconds c:
-    lookups['counts'] = 0
-
-    for exp_id in lookups[lk.EXP_ID].unique():
-        selector = lookups[lk.EXP_ID] == exp_id
-        lookups.loc[
-            selector, lk.TS
-        ] -= lookups[selector][lk.TS].min()
-
-    tp_per_exp = lookups.groupby(
-        [lk.PEER_DHT, lk.TS, lk.EXP_ID]
-    )['counts'].count().to_frame().reset_index()
-
-    # print(tp_per_exp)
-    # result.reset_index(inplace=True)
-
-    throughput = tp_per_exp.groupby([lk.PEER_DHT, lk.TS])['counts'].mean().to_frame()
-    # print(throughput)
-
-    throughput.reset_index(level=(lk.PEER_DHT,), inplace=True)
-    pivot_data = throughput.pivot(columns=lk.PEER_DHT, values='counts').fillna(0)
-    # print(pivot_data)
-
-    plt.figure(figsize=(12, 8))
+    center_xticks(ax)
+    ax.legend(title='Storage Nodes DHT')
+    ax.set_title('Average number of nodes published per CID', fontweight='bold')
+    ax.set_xlabel('DHT version', fontweight='bold')
+    ax.set_ylabel('Average number of nodes', fontweight='bold')
+    save_fig('avg-published-nodes.pdf', fig)
+
+def experiment_dhts(dhts : pd.Series) -> pd.Series:
+    # the secure and normal nodes are in the same (upgradable) experiments
+    return dhts.astype(str).replace(['Secure', 'Normal'], 'Normal vs Secure')
+
+@profiling.stage
+def calc_throughput(data: pd.DataFrame) -> pd.DataFrame:
+    lookups = data[[lk.TS, lk.EXP_ID, lk.LOOKUP_TIME]].assign(**{
+        lk.PEER_DHT : experiment_dhts(data[lk.PEER_DHT])
+    })
+    series = calc_time_series(lookups, lk.TS, lk.LOOKUP_TIME, lk.PEER_DHT, THROUGHPUT_BIN, [])
+    return pivot_time_series(series)
+
+def plot_time_series(pivot_data: pd.DataFrame, ylabel : str, title : str, filename : str):
+    fig = Figure(figsize=(12, 8))
+    ax  = fig.subplots()
 
     for dht_type in pivot_data.columns:
         aux = pivot_data[dht_type]
-        plt.plot(pivot_data.index, aux, label=dht_type)
+        ax.plot(pivot_data.index, aux, label=dht_type)
 
-    plt.legend(title='Experiment')
-    plt.xlabel('Times in minutes (after publish time)')
-    plt.ylabel('Throughput (operation/second)')
-    plt.title('Evoluation of throughput over the experiment')
+    ax.legend(title='Experiment')
+    ax.set_xlabel('Times in minutes (after publish time)')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
 
-    save_fig('throughput.pdf')
+    save_fig(filename, fig)
 
+@profiling.stage
+def plot_throughput(pivot_data: pd.DataFrame):
+    plot_time_series(
+        pivot_data, f'Throughput (operations per {THROUGHPUT_BIN} seconds)',
+        'Evoluation of throughput over the experiment', 'throughput.pdf'
+    )
 
+@profiling.stage
+def calc_publish_throughput(data: pd.DataFrame) -> pd.DataFrame:
+    # one row per storage node of each publish
+    publishes = data[[pb.EXP_ID, pb.SRC_PID, pb.CID, pb.TS, pb.DURATION]].drop_duplicates(
+        [pb.EXP_ID, pb.SRC_PID, pb.CID]
+    ).assign(**{
+        pb.SRC_DHT : experiment_dhts(data[pb.SRC_DHT])
+    })
+    series = calc_time_series(publishes, pb.TS, pb.DURATION, pb.SRC_DHT, THROUGHPUT_BIN, [])
+    return pivot_time_series(series)
+
+@profiling.stage
+def plot_publish_throughput(pivot_data: pd.DataFrame):
+    plot_time_series(
+        pivot_data, f'Throughput (publishes per {THROUGHPUT_BIN} seconds)',
+        'Evoluation of the publishes throughput over the experiment', 'publish-throughput.pdf'
+    )
 
-class GraphMetric:
-    data : dict[str, np.ndarray]
-    time : np.ndarray
-    def __init__(self, data, time):
-        self.data = data
-        self.time = time
+@profiling.stage
+def calc_lookup_latency_evolution(data: pd.DataFrame) -> pd.DataFrame:
+    data = data[data[lk.PROVIDERS] > 0] # type: ignore
+    return calc_time_series(
+        data, lk.TS, lk.LOOKUP_TIME, lk.PEER_DHT, THROUGHPUT_BIN, LATENCY_PERCENTILES
+    )
 
-def none_idx(values : list[list[Graph]]) -> list[list[int]]:
-    return [ 
-        [i for i, l in enumerate(list) if l is None] for list in values
-    ]
+@profiling.stage
+def plot_lookup_latency_evolution(series: pd.DataFrame):
+    fig = Figure(figsize=(12, 8))
+    ax  = fig.subplots()
+
+    styles = ['solid', 'dashed', 'dotted', 'dashdot']
+    for color, (dht_type, dht_series) in enumerate(series.groupby(level=0, observed=True)):
+        dht_series = dht_series.droplevel(0)
+        for style, percentile in zip(styles, LATENCY_PERCENTILES):
+            ax.plot(
+                dht_series.index, dht_series[percentile_column(percentile)], color=BARS_COLORS[1:][color % 3],
+                linestyle=style, label=f'{dht_type} ({percentile_column(percentile)})'
+            )
+
+    ax.legend(title='DHT version (percentile)')
+    ax.set_xlabel('Times in minutes (after publish time)')
+    ax.set_ylabel('Resolve time (ms)')
+    ax.set_title(f'Percentiles of the resolve time of every {THROUGHPUT_BIN} seconds')
+
+    save_fig('lookup-latency-evol.pdf', fig)
+
+
+class LatencyPercentiles(NamedTuple):
+    table    : pd.DataFrame # percentiles (columns) of each group (rows)
+    title    : str
+    filename : str
+
+class LatencyDistribution(NamedTuple):
+    sketches : dict[str, DDSketch] # by group label
+    title    : str
+    filename : str
+
+def lookup_group_label(key : tuple) -> str:
+    peer_dht, cid_type = key
+    return f'{peer_dht} peers\n{cid_type} CIDs'
+
+def calc_latency_percentiles(sketches : Sketches, keys : list[str], by : list[str], label : Callable[[tuple], str], title : str, filename : str) -> LatencyPercentiles:
+    # the experiments of each group merged
+    table = calc_latency_quantiles(regroup_sketches(sketches, keys, by), by, LATENCY_QUANTILES)
+    table.index = [label(key if isinstance(key, tuple) else (key,)) for key in table.index]
+    return LatencyPercentiles(table.drop(columns=['count', 'mean']), title, filename)
+
+def calc_latency_distribution(sketches : Sketches, keys : list[str], by : list[str], label : Callable[[tuple], str], title : str, filename : str) -> LatencyDistribution:
+    merged = regroup_sketches(sketches, keys, by)
+    return LatencyDistribution(
+        {label(key) : merged[key] for key in sorted(merged)}, title, filename
+    )
 
-def calc_graph_metric(
-        graphs : ExpGraphs, 
-        calc_metric : Callable[[Graph], float]
-    ) -> GraphMetric:
-    sample = graphs['Baseline'][0]
+@profiling.stage
+def calc_lookup_percentiles(sketches : Sketches) -> LatencyPercentiles:
+    return calc_latency_percentiles(
+        sketches, LOOKUP_KEYS, [lk.PEER_DHT, lk.CID_TYPE], lookup_group_label,
+        'Percentiles of the resolve time (ms)', 'lookup-latency-pcts.pdf'
+    )
 
-    min    = sample.count(None) # type: ignore
-    max    = len(sample)
-    assert min == 3
+@profiling.stage
+def calc_lookup_distribution(sketches : Sketches) -> LatencyDistribution:
+    return calc_latency_distribution(
+        sketches, LOOKUP_KEYS, [lk.PEER_DHT, lk.CID_TYPE], lookup_group_label,
+        'Distribution of the resolve time (ms)', 'lookup-latency-cdf.pdf'
+    )
 
-    data : dict[str, np.ndarray] = {}
-    for label, graph_lists in graphs.items():
-        assert [[0, 1, 2]] * len(graph_lists) == none_idx(graph_lists)
-        metric_results = np.array( [
-            [
-                calc_metric(g) for g in list[min:max]
-            ] for list in graph_lists
-        ])
+@profiling.stage
+def calc_publish_percentiles(sketches : Sketches) -> LatencyPercentiles:
+    return calc_latency_percentiles(
+        sketches, PUBLISH_KEYS, [pb.SRC_DHT], lambda key: key[0],
+        'Percentiles of the publish time (ms)', 'publish-latency-pcts.pdf'
+    )
 
-        data[label] = metric_results.mean(axis=0)
+@profiling.stage
+def calc_publish_distribution(sketches : Sketches) -> LatencyDistribution:
+    return calc_latency_distribution(
+        sketches, PUBLISH_KEYS, [pb.SRC_DHT], lambda key: key[0],
+        'Distribution of the publish time (ms)', 'publish-latency-cdf.pdf'
+    )
 
-    time = np.arange(min, max)
-    return GraphMetric(data, time)
+@profiling.stage
+def plot_latency_percentiles(data : LatencyPercentiles):
+    fig = Figure(figsize=(14, 6))
+    ax  = data.table.plot(
+        kind='bar', color=BARS_COLORS,
+        ax=fig.subplots(),
+    )
 
-def plot_clustering_coefficiency(graphs : ExpGraphs):
+    for cnt in ax.containers:
+        ax.bar_label(cnt, labels=[round(v) if v > 0.0 else '' for v in cnt.datavalues], fontsize=8)
+
+    center_xticks(ax)
+    ax.set_yscale('log')
+    ax.legend(title='Percentile')
+    ax.set_ylabel('time (ms)', fontweight='bold')
+    ax.set_title(data.title, fontweight='bold')
+    save_fig(data.filename, fig)
+
+@profiling.stage
+def plot_latency_distribution(data : LatencyDistribution):
+    fig = Figure(figsize=(16, 6), layout='constrained')
+    cdf_ax, hist_ax = fig.subplots(ncols=2)
+
+    for label, sketch in data.sketches.items():
+        label = label.replace('\n', ' / ')
+        bounds, fractions = sketch.cdf()
+        cdf_ax.step(bounds, fractions, where='post', label=label)
+
+        # as a fraction of the operations, so that the groups can be compared
+        counts, edges = sketch.histogram(LATENCY_BINS_PER_DECADE)
+        hist_ax.stairs(counts / max(sketch.count, 1), edges, label=label)
+
+    for ax, ylabel in [(cdf_ax, 'Fraction of the operations (CDF)'), (hist_ax, 'Fraction of the operations')]:
+        ax.set_xscale('log')
+        ax.set_xlabel('time (ms)', fontweight='bold')
+        ax.set_ylabel(ylabel, fontweight='bold')
+        ax.legend(title='DHT version')
+
+    fig.suptitle(data.title, fontweight='bold')
+    save_fig(data.filename, fig)
+
+
+class GraphMetric(NamedTuple):
+    results  : pd.Series
+    ylabel   : str
+    filename : str
+    upper    : pd.Series | None = None # upper bound of each result
+    error    : pd.Series | None = None # half width of each result confidence interval
 
-    metric = calc_graph_metric(
-        graphs, lambda g : g.transitivity_undirected()
+def calc_graph_metric(
+        metrics  : pd.DataFrame,
+        name     : str,
+        ylabel   : str,
+        filename : str,
+        high     : str | None = None,
+        err      : str | None = None
+    ) -> GraphMetric:
+    def average(name : str) -> pd.Series:
+        data = metrics[metrics[gm.METRIC] == name]
+        # average of the experiments of each label
+        return data.groupby([gm.EXPERIMENT, gm.SNAPSHOT_NR])[gm.VALUE].mean()
+
+    # error band of the approximated metrics (see graph_metrics.approx_metric)
+    return GraphMetric(
+        average(name), ylabel, filename,
+        average(high) if high is not None else None,
+        average(err)  if err  is not None else None
     )
 
-    results = metric.data
-    time    = metric.time
+@profiling.stage
+def plot_graph_metric(metric : GraphMetric):
+    results, upper, error = metric.results, metric.upper, metric.error
 
-    plt.figure()
-    for label, values in results.items():
-        plt.plot(
+    fig = Figure()
+    ax  = fig.subplots()
+    for label, values in results.groupby(level=gm.EXPERIMENT):
+        time = values.index.get_level_values(gm.SNAPSHOT_NR)
+        ax.plot(
             time, values.round(2), label=label
         )
-
-    plt.legend(title='Experiments')
-    plt.ylabel('Average clustering degree')
-    plt.xlabel('Time since the start of the experiment (minutes)')
-    save_fig('clustering-coefficiency.pdf')
-
-def plot_diameter(graphs : ExpGraphs):
-
-    metric = calc_graph_metric(
-        # graphs, lambda g : len(g.average_path_length())    
-        graphs, lambda g : g.diameter()
+        if upper is not None:
+            ax.fill_between(time, values, upper.loc[label], alpha=0.2)
+        elif error is not None:
+            ax.fill_between(time, values - error.loc[label], values + error.loc[label], alpha=0.2)
+
+    ax.legend(title='Experiments')
+    ax.set_ylabel(metric.ylabel)
+    ax.set_xlabel('Time since the start of the experiment (minutes)')
+    save_fig(metric.filename, fig)
+
+@profiling.stage
+def calc_clustering_coefficiency(metrics : pd.DataFrame) -> GraphMetric:
+    return calc_graph_metric(
+        metrics, 'clustering', 'Average clustering degree', 'clustering-coefficiency.pdf'
     )
 
-    results = metric.data
-    time    = metric.time
-    
-    plt.figure()
-    for label, values in results.items():
-        plt.plot(
-            time, values.round(2), label=label
+@profiling.stage
+def calc_diameter(metrics : pd.DataFrame) -> GraphMetric:
+    if GRAPH_SAMPLES > 0:
+        name, high = approx_metrics('diameter', GRAPH_SAMPLES)
+        return calc_graph_metric(
+            metrics, name, f'Diameter of the graph (estimated from {GRAPH_SAMPLES} nodes)',
+            'graph-diameter.pdf', high=high
         )
-    
-    plt.legend(title='Experiments')
-    plt.ylabel('Diameter of the graph')
-    plt.xlabel('Time since the start of the experiment (minutes)')
-    save_fig('graph-diameter.pdf')
-
-def plot_node_degree(graphs : ExpGraphs):
-    metric = calc_graph_metric(
-        graphs, lambda g : np.mean(g.degree())
+    return calc_graph_metric(
+        metrics, 'diameter', 'Diameter of the graph', 'graph-diameter.pdf'
     )
 
-    results = metric.data
-    time    = metric.time
-
-    plt.figure()
-    for label, values in results.items():
-        plt.plot(
-            time, values.round(2), label=label
+@profiling.stage
+def calc_path_length(metrics : pd.DataFrame) -> GraphMetric:
+    if GRAPH_SAMPLES > 0:
+        name, err = approx_metrics('path-length', GRAPH_SAMPLES)
+        return calc_graph_metric(
+            metrics, name, f'Average path length (estimated from {GRAPH_SAMPLES} nodes)',
+            'avg-path-length.pdf', err=err
         )
+    return calc_graph_metric(
+        metrics, 'path-length', 'Average path length', 'avg-path-length.pdf'
+    )
+
+@profiling.stage
+def calc_node_degree(metrics : pd.DataFrame) -> GraphMetric:
+    return calc_graph_metric(
+        metrics, 'degree', 'Average node degree', 'avg-node-degree.pdf'
+    )
 
-    plt.legend(title='Experiments')
-    plt.ylabel('Average node degree')
-    plt.xlabel('Time since the start of the experiment (minutes)')
-    save_fig('avg-node-degree.pdf')
+def graph_metrics_names(metrics : list[str] = ['clustering', 'degree', 'diameter', 'path-length']) -> list[str]:
+    names = []
+    for metric in metrics:
+        if GRAPH_SAMPLES > 0 and metric in APPROX_METRICS:
+            names += approx_metrics(metric, GRAPH_SAMPLES)
+        else:
+            names.append(metric)
+    return names
 
 
 # import networkx as nx
@@ -595,10 +776,7 @@ def plot_node_degree(graphs : ExpGraphs):
 #         (snapshots[sp.EXP_ID] == 0) & (snapshots[sp.SNAPSHOT_NR] == 30)
 #     ])
 #
-#     mapping = build_pid_to_idx_mappping(nodes)
-#     edges = [
-#         (int(mapping[src]), int(mapping[dst])) for [src, dst] in nodes[[sp.SRC_PID, sp.DST_PID]].values
-#     ]
+#     edges = nodes[[sp.SRC_PID, sp.DST_PID]].values
 #
 #     G = nx.DiGraph()
 #     G.add_edges_from(edges)
@@ -614,7 +792,15 @@ def plot_node_degree(graphs : ExpGraphs):
 #     plt.show()
 
 
+@profiling.stage
 def read_data(filename : str) -> pd.DataFrame:
+    if filename.endswith('.parquet'):
+        data = pd.read_parquet(filename)
+        # the dht versions are categorical columns, so only their categories are renamed
+        for col in data.select_dtypes('category').columns:
+            data[col] = data[col].cat.rename_categories(DHT_NAMES)
+        return data
+
     data = pd.read_csv(filename, low_memory=False)
 
     # NOTE: Akos said is not relevant at all having all here
@@ -622,51 +808,80 @@ def read_data(filename : str) -> pd.DataFrame:
     # aux[lk.PEER_DHT] = 'All'
     # aux[lk.CID_TYPE] = 'All'
 
-    for old, new in [
-        ('DEFAULT', 'Baseline'),
-        ('SECURE', 'Secure'),
-        ('NORMAL', 'Normal')
-    ]:
+    for old, new in DHT_NAMES.items():
         data.replace(old, new, inplace=True)
 
     return data
 
-def build_pid_to_idx_mappping(data : pd.DataFrame) -> dict[str, int]:
-    nodes   = data[sp.SRC_PID].unique() # type: ignore
-    indexes = np.arange(nodes.shape[0], dtype=int)
-    return dict(zip(
-        nodes, indexes
-    ))
+def table_file(name : str) -> str:
+    # prefer the parquet table (if the parser generated one)
+    filename = f'{name}.parquet'
+    return filename if path.exists(filename) else f'{name}.csv'
+
+def partition_exp_id(filename : str) -> int:
+    return int(path.basename(filename).split('.')[0].removeprefix('exp-'))
+
+def table_files(name : str) -> list[str]:
+    """
+    Files of a table: one per experiment if it was partitioned by the parser
+    (see main.py --partitioned), otherwise the table file.
+    """
+    if not path.isdir(name):
+        return [table_file(name)]
+    partitions = glob(f'{name}/exp-*.parquet') or glob(f'{name}/exp-*.csv')
+    return sorted(partitions, key=partition_exp_id)
+
+def read_table(name : str) -> pd.DataFrame:
+    parts = [read_data(filename) for filename in table_files(name)]
+    return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+def map_partitions(name : str, func : Callable[[pd.DataFrame], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenation of func's results over every partition of the table, which
+    are read one at a time (func must not mix different experiments rows).
+    """
+    return pd.concat(
+        [func(read_data(filename)) for filename in table_files(name)], ignore_index=True
+    )
 
+@profiling.stage
 def build_graphs(data: pd.DataFrame) -> ExpGraphs:
     graphs = {
-        'Baseline'         : [],
-        'Normal vs Secure' : []
+        'Baseline'         : {},
+        'Normal vs Secure' : {}
     }
 
-    for exp_id in data[sp.EXP_ID].unique():
-        rows = cast(pd.DataFrame, data[data[sp.EXP_ID] == exp_id])
-        id   = rows[sp.SRC_DHT].iloc[0] # type: ignore
-        graph_list = graphs[ 
+    # rows of each experiment (in order of appearance) made contiguous
+    exp_codes, exp_ids = pd.factorize(data[sp.EXP_ID])
+    by_exp  = np.argsort(exp_codes, kind='stable')
+    bounds  = np.flatnonzero(np.diff(exp_codes[by_exp])) + 1
+
+    src_pids  = data[sp.SRC_PID].to_numpy()[by_exp]
+    dst_pids  = data[sp.DST_PID].to_numpy()[by_exp]
+    snaps_nrs = data[sp.SNAPSHOT_NR].to_numpy()[by_exp]
+    dhts      = data[sp.SRC_DHT].to_numpy()[by_exp]
+
+    for exp_id, rows in zip(exp_ids, np.split(np.arange(len(by_exp)), bounds)):
+        id   = dhts[rows[0]]
+        exp_graphs = graphs[ 
             'Baseline' if id == 'Baseline' else 'Normal vs Secure'
         ]
 
-        snaps_nrs : np.ndarray = rows[sp.SNAPSHOT_NR].unique() # type: ignore
-        snaps_nrs.sort()
-
-        snaps_graphs = [None] * (snaps_nrs.max() + 1)
-        nodes_idx = build_pid_to_idx_mappping(rows)
+        # vertices are numbered by order of appearance of the source nodes
+        src, dst = src_pids[rows], dst_pids[rows]
+        codes, _ = pd.factorize(np.concatenate([src, dst]))
+        edges    = np.column_stack([codes[:len(rows)], codes[len(rows):]])
 
-        for nr in snaps_nrs:
-            snaps_records = cast(pd.DataFrame, rows[rows[sp.SNAPSHOT_NR] == nr])
-            edges = snaps_records[[sp.SRC_PID, sp.DST_PID]].values
-            edges = [
-                (nodes_idx[src], nodes_idx[dst]) for [src, dst] in edges
-            ]
+        # one block of edges per snapshot
+        snaps    = snaps_nrs[rows]
+        by_snap  = np.argsort(snaps, kind='stable')
+        nrs, starts = np.unique(snaps[by_snap], return_index=True)
 
-            snaps_graphs[nr] = Graph(edges=edges, directed=True)
+        snaps_graphs = [None] * (nrs.max() + 1)
+        for nr, snap_edges in zip(nrs, np.split(edges[by_snap], starts[1:])):
+            snaps_graphs[nr] = Graph(edges=snap_edges, directed=True)
 
-        graph_list.append(snaps_graphs)
+        exp_graphs[int(exp_id)] = snaps_graphs
 
     return graphs
 
@@ -678,28 +893,193 @@ def build_graphs(data: pd.DataFrame) -> ExpGraphs:
 #   - some clean up of the code (someday)
 #   - improve routing table end state readability
 #   - max of the mininum paths (network diameter)
-def main():
-    lookups = read_data('lookups.csv')
-    plot_avg_success_resolve(lookups)
-    plot_success_rate(lookups)
-    plot_avg_resolve_queries(lookups)
-    plot_cids_lookups(lookups)
-    plot_throughput(lookups)
-
-    snapshots = read_data('snapshots.csv')
-    graphs    = build_graphs(snapshots)
-    plot_clustering_coefficiency(graphs)
-    plot_node_degree(graphs)
-    plot_diameter(graphs)
-
-    plot_rt_evolution(snapshots)
-    plot_end_rt_state(snapshots)
-    
-    publishes = read_data('publishes.csv')
-    plot_publish_nodes(publishes)
-    plot_puslibh_time(publishes)
-    plot_publish_queries(publishes)
+class ChartsData:
+    """
+    Tables (and the data derived from them) the charts are drawn from, each
+    one is only loaded (or calculated) the first time a chart needs it and
+    then shared by the other charts.
+    """
+    def __init__(self, metrics : list[str], jobs : int | None = None):
+        self.metrics_names = metrics
+        self.jobs          = jobs # processes of the graph metrics (default: the number of cpus)
+
+    @cached_property
+    def lookups(self) -> pd.DataFrame:
+        return read_table('lookups')
+
+    @cached_property
+    def publishes(self) -> pd.DataFrame:
+        return read_table('publishes')
+
+    # NOTE: the snapshots table (by far the largest) is never loaded as a
+    # whole, the data derived from it is calculated one experiment at a time
+
+    # the totals and the latency sketches are calculated one partition at a
+    # time (unless the whole table was already loaded) and merged
+
+    @cached_property
+    def lookup_totals(self) -> pd.DataFrame:
+        if 'lookups' in self.__dict__:
+            return calc_lookup_totals(self.lookups)
+        return sum_totals(map_partitions('lookups', calc_lookup_totals), LOOKUP_GROUPS)
+
+    @cached_property
+    def publish_totals(self) -> PublishTotals:
+        if 'publishes' in self.__dict__:
+            return calc_publish_totals(self.publishes)
+        return merge_publish_totals([calc_publish_totals(read_data(filename)) for filename in table_files('publishes')])
+
+    @cached_property
+    def lookup_sketches(self) -> Sketches:
+        if 'lookups' in self.__dict__:
+            return calc_lookup_sketches(self.lookups)
+        return merge_sketches(calc_lookup_sketches(read_data(filename)) for filename in table_files('lookups'))
+
+    @cached_property
+    def publish_sketches(self) -> Sketches:
+        if 'publishes' in self.__dict__:
+            return calc_publish_sketches(self.publishes)
+        return merge_sketches(calc_publish_sketches(read_data(filename)) for filename in table_files('publishes'))
+
+    @cached_property
+    def rt_cube(self) -> pd.DataFrame:
+        # tables parsed before the cube was added only have the snapshots
+        if path.isdir('rt-cube') or path.exists(table_file('rt-cube')):
+            return read_table('rt-cube')
+        return map_partitions('snapshots', calc_rt_cube)
+
+    @cached_property
+    def rt_composition(self) -> pd.DataFrame:
+        return calc_rt_composition(self.rt_cube)
+
+    @cached_property
+    def metrics(self) -> pd.DataFrame:
+        metrics = map_partitions(
+            'snapshots', lambda snapshots: calc_graph_metrics(build_graphs(snapshots), self.metrics_names, self.jobs)
+        )
+        # same rows order as the metrics of all the graphs at once
+        return metrics.sort_values(gm.EXPERIMENT, kind='stable', ignore_index=True)
+
+class Chart(NamedTuple):
+    calc   : Callable[[Any], Any]  # aggregates the data shown by the chart
+    plot   : Callable[[Any], None] # draws (and saves) the chart of calc's result
+    data   : str                   # ChartsData attribute calc gets
+    metric : str | None = None     # graph metric it needs (if data is 'metrics')
+
+# charts by name (the name of their file, or files, without the extension)
+CHARTS : dict[str, Chart] = {
+    'avg-resolve'             : Chart(calc_avg_success_resolve, plot_avg_success_resolve, 'lookup_totals'),
+    'success-rate'            : Chart(calc_success_rate, plot_success_rate, 'lookup_totals'),
+    'avg-res-queries'         : Chart(calc_avg_resolve_queries, plot_avg_resolve_queries, 'lookup_totals'),
+    'lookup-hist'             : Chart(calc_cids_lookups, plot_cids_lookups, 'lookup_totals'),
+    'throughput'              : Chart(calc_throughput, plot_throughput, 'lookups'),
+    'lookup-latency-evol'     : Chart(calc_lookup_latency_evolution, plot_lookup_latency_evolution, 'lookups'),
+    'lookup-latency-pcts'     : Chart(calc_lookup_percentiles, plot_latency_percentiles, 'lookup_sketches'),
+    'lookup-latency-cdf'      : Chart(calc_lookup_distribution, plot_latency_distribution, 'lookup_sketches'),
+    'clustering-coefficiency' : Chart(calc_clustering_coefficiency, plot_graph_metric, 'metrics', 'clustering'),
+    'avg-node-degree'         : Chart(calc_node_degree, plot_graph_metric, 'metrics', 'degree'),
+    'graph-diameter'          : Chart(calc_diameter, plot_graph_metric, 'metrics', 'diameter'),
+    'avg-path-length'         : Chart(calc_path_length, plot_graph_metric, 'metrics', 'path-length'),
+    'rt-buckets-evol'         : Chart(calc_rt_buckets_evolution, plot_rt_evolution, 'rt_composition'),
+    'rt-end-state'            : Chart(calc_end_rt_state, plot_end_rt_state, 'rt_composition'),
+    'avg-published-nodes'     : Chart(calc_publish_nodes, plot_publish_nodes, 'publish_totals'),
+    'avg-publish-time'        : Chart(calc_publish_time, plot_publish_time, 'publish_totals'),
+    'avg-publish-queries'     : Chart(calc_publish_queries, plot_publish_queries, 'publish_totals'),
+    'publish-throughput'      : Chart(calc_publish_throughput, plot_publish_throughput, 'publishes'),
+    'publish-latency-pcts'    : Chart(calc_publish_percentiles, plot_latency_percentiles, 'publish_sketches'),
+    'publish-latency-cdf'     : Chart(calc_publish_distribution, plot_latency_distribution, 'publish_sketches'),
+}
+
+def _init_worker(profile : bool, trace_memory : bool, throughput_bin : int):
+    global THROUGHPUT_BIN
+    THROUGHPUT_BIN = throughput_bin
+    if profile:
+        # the records are sent back with each chart (never saved by the worker)
+        profiling.enable(report=None, trace_memory=trace_memory)
+        profiling.take_records()
+
+def _plot_task(plot : Callable[[Any], None], data : Any) -> list[profiling.StageRecord]:
+    plot(data)
+    return profiling.take_records()
+
+def draw_charts(data : ChartsData, charts : list[Chart], jobs : int = 1):
+    """
+    Calculates the data of each chart (in this process) and draws them
+    using a pool of `jobs` processes, which only get the aggregated data.
+    A chart is drawn while the data of the next ones is calculated.
+    """
+    if jobs <= 1:
+        for chart in charts:
+            chart.plot(chart.calc(getattr(data, chart.data)))
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(profiling.enabled, profiling.memory, THROUGHPUT_BIN)
+    ) as pool:
+        tasks = [
+            pool.submit(_plot_task, chart.plot, chart.calc(getattr(data, chart.data)))
+                for chart in charts
+        ]
+        for task in tasks:
+            profiling.add_records(task.result())
+
+def charts_names(value : str) -> list[str]:
+    names   = [name.strip().removesuffix('.pdf') for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CHARTS]
+    if len(unknown) > 0:
+        raise argparse.ArgumentTypeError(
+            f'unknown charts: {", ".join(unknown)} (see --list)'
+        )
+    return names
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Generates the charts from the parsed tables.'
+    )
+    parser.add_argument(
+        '--only', type=charts_names, metavar='CHART[,CHART...]',
+        help='only generate these charts (default: all of them)'
+    )
+    parser.add_argument(
+        '--list', action='store_true', help='list the charts names and exit'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help='number of processes that draw the charts and calculate the graph metrics (default: 1)'
+    )
+    parser.add_argument(
+        '--bin-width', type=int, default=THROUGHPUT_BIN, metavar='SECONDS',
+        help=f'width of the time bins of the throughput and latency evolution charts (default: {THROUGHPUT_BIN})'
+    )
+    parser.add_argument(
+        '--graph-samples', type=int, default=GRAPH_SAMPLES, metavar='N',
+        help=f'sampled nodes of the diameter and path length estimates, 0 for the exact ones (default: {GRAPH_SAMPLES})'
+    )
+    profiling.add_arguments(parser)
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    opts = parse_args(args)
+    if opts.list:
+        print('\n'.join(CHARTS.keys()))
+        return
+
+    profiling.enable_from(opts)
+
+    global THROUGHPUT_BIN, GRAPH_SAMPLES
+    THROUGHPUT_BIN = opts.bin_width
+    GRAPH_SAMPLES  = opts.graph_samples
+
+    # in the CHARTS order, so charts of the same data are drawn one after the other
+    selected = [
+        chart for name, chart in CHARTS.items() if opts.only is None or name in opts.only
+    ]
+    data = ChartsData(graph_metrics_names([
+        chart.metric for chart in selected if chart.metric is not None
+    ]), opts.jobs)
+
+    draw_charts(data, selected, opts.jobs)
 
 if __name__ == '__main__':
     __init__()
-    main()
+    main(sys.argv)
@@ -0,0 +1,85 @@
+import json
+
+from typing import Any, Callable
+
+# Decoding of the JSON records of the logs. The fastest of the supported
+# libraries that is installed is used (simdjson, orjson and the standard json
+# module, in that order), see use_backend() to pick one.
+
+try:
+    import simdjson # pip install pysimdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ['simdjson', 'orjson', 'json']
+
+# (cid, time_ms, type, providers-nr, queries-nr)
+LookupFields  = tuple[str, float, str, int, int]
+# (cid, time_ms, queries-nr, store_nodes)
+PublishFields = tuple[str, float, int, list[str]]
+
+loads : Callable[[str | bytes], Any] = json.loads
+backend = 'json'
+
+_parser = None
+
+def _simdjson_lookup(data : str | bytes) -> LookupFields:
+    # the lists are never turned into python objects, only their lengths
+    # are read (the parser is reused, so no reference to doc can survive)
+    doc = _parser.parse(data) # type: ignore
+    return (
+        doc['cid'], doc['time_ms'], doc['type'], len(doc['providers']), len(doc['queries'])
+    )
+
+def _simdjson_publish(data : str | bytes) -> PublishFields:
+    doc = _parser.parse(data) # type: ignore
+    store_nodes = doc.get('store_nodes')
+    return (
+        doc['cid'], doc['time_ms'], len(doc['queries']),
+        store_nodes.as_list() if store_nodes is not None else []
+    )
+
+def _loads_lookup(data : str | bytes) -> LookupFields:
+    rec = loads(data)
+    return (
+        rec['cid'], rec['time_ms'], rec['type'], len(rec['providers']), len(rec['queries'])
+    )
+
+def _loads_publish(data : str | bytes) -> PublishFields:
+    rec = loads(data)
+    return (
+        rec['cid'], rec['time_ms'], len(rec['queries']), rec.get('store_nodes') or []
+    )
+
+decode_lookup  : Callable[[str | bytes], LookupFields]  = _loads_lookup
+decode_publish : Callable[[str | bytes], PublishFields] = _loads_publish
+
+def use_backend(name : str):
+    global loads, backend, decode_lookup, decode_publish, _parser
+
+    if name == 'simdjson' and simdjson is not None:
+        _parser = simdjson.Parser()
+        loads   = simdjson.loads
+        decode_lookup, decode_publish = _simdjson_lookup, _simdjson_publish
+    elif name == 'orjson' and orjson is not None:
+        loads = orjson.loads
+        decode_lookup, decode_publish = _loads_lookup, _loads_publish
+    elif name == 'json':
+        loads = json.loads
+        decode_lookup, decode_publish = _loads_lookup, _loads_publish
+    else:
+        raise Exception(f'JSON backend "{name}" is not available')
+
+    backend = name
+
+def available_backends() -> list[str]:
+    return [
+        name for name, lib in zip(BACKENDS, [simdjson, orjson, json]) if lib is not None
+    ]
+
+use_backend(available_backends()[0])
@@ -0,0 +1,280 @@
+#! /usr/bin/env python3
+
+import argparse
+import glob
+import json
+import logging as log
+import os
+import signal
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from collections import Counter
+from datetime import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import decoders
+from main import DhtType, load_cids, load_node_info
+from summary import Summary, LOOKUP_TIME, PUBLISH_TIME
+from utils import Lookups as lk
+from utils import Publishes as pv
+
+# Follows the logs of a running experiment (its shared logs directory, where
+# docker/start_experiment.sh links the look-ups, publishes and cids logs of
+# each node if EXP_FOLLOW_LOGS is true) and reports, every few seconds, the success rate, the latency
+# percentiles and the throughput of each DHT type so far. The records are
+# added to a summary (see summary.py) as they are read, so memory does not
+# grow with the length of the experiment.
+
+INTERVAL = 5
+
+REPORT_QUANTILES = [0.5, 0.9, 0.99]
+
+# look-ups of cids in no cids log read so far are retried for PENDING_POLLS
+# polls (and at most MAX_PENDING are kept), then they are counted as not
+# resolved with an UNKNOWN_CID type (e.g. the cids of the nodes that failed)
+PENDING_POLLS = 12
+MAX_PENDING   = 100_000
+UNKNOWN_CID   = 'UNKNOWN'
+
+class LogTail:
+    """
+    The complete lines appended to a file since the last read (the file
+    might not exist yet).
+    """
+    def __init__(self, filename : str):
+        self.filename = filename
+        self.offset   = 0
+        self.partial  = b''
+
+    def read_lines(self) -> list[str]:
+        try:
+            with open(self.filename, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < self.offset:
+                    # truncated (e.g. the node restarted)
+                    self.offset, self.partial = 0, b''
+                file.seek(self.offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+
+        self.offset += len(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        return [line.decode() for line in lines if line.strip()]
+
+def decode_records(lines : list[str], decode) -> list:
+    records = []
+    for line in lines:
+        try:
+            records.append(decode(line.split(' ', maxsplit=2)[-1]))
+        except (ValueError, KeyError, TypeError):
+            log.warning("Discarding malformed record: %s", line[:80])
+    return records
+
+class Follower:
+    def __init__(self, dirname : str):
+        self.dirname = dirname
+        self.nodes      : dict[str, str]     = {} # dht type of each node (that wrote its .info)
+        self.cids_type  : dict[str, str]     = {}
+        self.cids_sizes : dict[str, int]     = {} # size of each cids log when it was read
+        self.lookups    : dict[str, LogTail] = {}
+        self.publishes  : dict[str, LogTail] = {}
+        # look-ups of cids not in the cids logs read so far (and the poll
+        # they were read by), see PENDING_POLLS
+        self.pending    : list[tuple]        = []
+        self.polls      = 0
+        self.summary    = Summary()
+
+    def discover(self):
+        for info_file in glob.glob(f'{self.dirname}/*.info'):
+            pid = os.path.basename(info_file).removesuffix('.info')
+            if pid in self.nodes:
+                continue
+            try:
+                info = load_node_info(info_file)
+            except ValueError:
+                continue # still being written
+            self.nodes[pid]     = DhtType.parse_from(info['mode']).name
+            self.lookups[pid]   = LogTail(f'{self.dirname}/{pid}-lookup-times.log')
+            self.publishes[pid] = LogTail(f'{self.dirname}/{pid}-publish.log')
+
+        for pid, dht in self.nodes.items():
+            filename = f'{self.dirname}/{pid}-cids.log'
+            try:
+                size = os.path.getsize(filename)
+                if self.cids_sizes.get(filename) != size:
+                    self.cids_type.update(dict.fromkeys(load_cids(filename), dht))
+                    self.cids_sizes[filename] = size
+            except (FileNotFoundError, ValueError, IndexError):
+                continue
+
+    def cid_type(self, cid : str, rec_type : str) -> str | None:
+        # the look-up record only has the type of the non default cids
+        c_type = self.cids_type.get(cid)
+        if c_type is None and rec_type != '':
+            c_type = DhtType.parse_from(rec_type).name
+        return c_type
+
+    def poll(self) -> Summary:
+        """
+        Reads the records written since the last poll, they are added to
+        the summary and returned as a summary of their own.
+        """
+        self.discover()
+        self.polls += 1
+
+        lookups, publishes, pending = [], [], self.pending
+        for pid, dht in self.nodes.items():
+            pending.extend(
+                (self.polls, dht, *record) for record in decode_records(
+                    self.lookups[pid].read_lines(), decoders.decode_lookup
+                )
+            )
+
+            for cid, time_ms, queries, store_nodes in decode_records(
+                self.publishes[pid].read_lines(), decoders.decode_publish
+            ):
+                # one row per storage node, only whether there is one matters
+                for stored in ([0] * len(store_nodes) or [-1]):
+                    publishes.append((dht, pid, cid, queries, time_ms, stored))
+
+        self.pending = []
+        for poll, dht, cid, time_ms, rec_type, providers, queries in pending:
+            c_type = self.cid_type(cid, rec_type)
+            if c_type is not None:
+                lookups.append((dht, c_type, time_ms, providers, queries))
+            elif self.polls - poll >= PENDING_POLLS:
+                lookups.append((dht, UNKNOWN_CID, time_ms, 0, queries))
+            else:
+                self.pending.append((poll, dht, cid, time_ms, rec_type, providers, queries))
+
+        # the oldest ones go first
+        expired, self.pending = self.pending[:-MAX_PENDING], self.pending[-MAX_PENDING:]
+        for _, dht, _, time_ms, _, _, queries in expired:
+            lookups.append((dht, UNKNOWN_CID, time_ms, 0, queries))
+
+        new = Summary()
+        new.add_lookups(pd.DataFrame(
+            lookups, columns=[lk.PEER_DHT, lk.CID_TYPE, lk.LOOKUP_TIME, lk.PROVIDERS, lk.QUERIES]
+        ))
+        new.add_publishes(pd.DataFrame(
+            publishes, columns=[pv.SRC_DHT, pv.SRC_PID, pv.CID, pv.QUERIES_NR, pv.DURATION, pv.STORAGE_NODE]
+        ))
+        self.summary.merge(new)
+        return new
+
+    def report(self, new : Summary, seconds : float | None) -> pd.DataFrame:
+        """
+        Per peer DHT type: the nodes, the look-ups (success rate and resolve
+        time percentiles) and the publishes so far, and the rate of both in
+        the last `seconds` (the ones of `new`).
+        """
+        by     = [lk.PEER_DHT]
+        total  = self.summary.with_exp_id(0)
+        counts = total.counts().groupby(level=by).sum().reindex(
+            columns=['lookups', 'resolved', 'publishes'], fill_value=0
+        )
+        dhts   = sorted(set(self.nodes.values()) | set(counts.index))
+        counts = counts.reindex(dhts, fill_value=0)
+        latest = new.with_exp_id(0).counts().groupby(level=by).sum().reindex(
+            index=dhts, columns=['lookups', 'publishes'], fill_value=0
+        )
+
+        lookup_times  = total.quantiles(LOOKUP_TIME, by, REPORT_QUANTILES).reindex(dhts)
+        publish_times = total.quantiles(PUBLISH_TIME, by, [0.5, 0.99]).reindex(dhts)
+
+        table = pd.DataFrame(index=pd.Index(dhts, name=lk.PEER_DHT))
+        table['nodes']        = pd.Series(Counter(self.nodes.values())).reindex(dhts, fill_value=0)
+        table['lookups']      = counts['lookups']
+        table['success (%)']  = (counts['resolved'] / counts['lookups'].where(counts['lookups'] > 0) * 100).round(1)
+        for column in lookup_times.columns.drop(['count', 'mean']):
+            table[f'resolve {column} (ms)'] = lookup_times[column].round(0)
+        table['lookups/s']    = (latest['lookups'] / seconds).round(2) if seconds else float('nan')
+        table['publishes']    = counts['publishes']
+        for column in publish_times.columns.drop(['count', 'mean']):
+            table[f'publish {column} (ms)'] = publish_times[column].round(0)
+        table['publishes/s']  = (latest['publishes'] / seconds).round(2) if seconds else float('nan')
+        return table
+
+# the last report, served as json by --serve
+_latest : dict = {}
+
+class ReportHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(_latest).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+def serve(port : int):
+    server = ThreadingHTTPServer(('', port), ReportHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("serving the reports on http://localhost:%d/", port)
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Reports the look-ups and publishes of a running experiment as its logs are written.'
+    )
+    parser.add_argument('directory', help='the experiment logs directory (SHARED_LOG_DIR)')
+    parser.add_argument(
+        '-i', '--interval', type=float, default=INTERVAL, metavar='SECONDS',
+        help=f'seconds between reports (default: {INTERVAL})'
+    )
+    parser.add_argument('--serve', type=int, metavar='PORT', help='also serve the last report as json on PORT')
+    parser.add_argument(
+        '--summary', metavar='FILE',
+        help='save the summary of the records read (see summary.py) to FILE when it stops'
+    )
+    parser.add_argument('--once', action='store_true', help='report what was written so far and exit')
+    parser.add_argument(
+        '--json', choices=decoders.available_backends(), default=decoders.backend,
+        help=f'library used to decode the logs JSON records (default: {decoders.backend})'
+    )
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    global _latest
+    opts = parse_args(args)
+    decoders.use_backend(opts.json)
+    log.basicConfig(level=log.INFO, format="%(levelname)s: %(message)s")
+
+    if opts.serve is not None:
+        serve(opts.serve)
+
+    # stopped like with ctrl-c (e.g. by the script that started it)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    follower = Follower(opts.directory)
+    previous = None
+    try:
+        while True:
+            start   = time.monotonic()
+            new     = follower.poll()
+            seconds = start - previous if previous is not None else None
+            previous = start
+
+            table = follower.report(new, seconds)
+            now   = dt.now().strftime('%H:%M:%S')
+            print(f'\n[{now}] {len(follower.nodes)} nodes', table.to_string(), sep='\n', flush=True)
+            _latest = {'time' : now, 'nodes' : len(follower.nodes), 'dhts' : json.loads(table.to_json(orient='index'))}
+
+            if opts.once:
+                break
+            time.sleep(max(0.0, opts.interval - (time.monotonic() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if opts.summary:
+            follower.summary.with_exp_id(0).save(opts.summary)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,220 @@
+import os
+import hashlib
+import pickle
+import numpy as np
+import pandas as pd
+
+from igraph import Graph
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import GraphMetrics as gm
+import profiling
+
+# experiment label -> experiment id -> graph of each snapshot (None if there
+# are no records of that snapshot)
+type ExpGraphs = dict[str, dict[int, list[Graph | None]]]
+
+def avg_degree(g : Graph) -> float:
+    return float(np.mean(g.degree()))
+
+def clustering(g : Graph) -> float:
+    return g.transitivity_undirected()
+
+def diameter(g : Graph) -> float:
+    return g.diameter()
+
+def path_length(g : Graph) -> float:
+    return g.average_path_length()
+
+# NOTE: they must be module functions so that they can be sent to the workers
+GRAPH_METRICS : dict[str, Callable[[Graph], float]] = {
+    'clustering'  : clustering,
+    'degree'      : avg_degree,
+    'diameter'    : diameter,
+    'path-length' : path_length,
+}
+
+# Approximations of the diameter and of the average path length for large
+# graphs, where the exact ones (all-pairs BFS) take too long. They are named
+# '<metric>@<samples>[:<bound>]', e.g. 'diameter@64' is the diameter estimated
+# with BFSs from 64 random sources, 'diameter@64:high' its upper bound and
+# 'path-length@64:err' the 95% confidence interval (half width) of 'path-length@64'.
+APPROX_METRICS = ['diameter', 'path-length']
+
+# the sources are always the same (for a given graph and number of samples)
+SAMPLES_SEED = 0
+
+class SampledDistances:
+    def __init__(self, g : Graph, samples : int):
+        rng = np.random.default_rng(SAMPLES_SEED)
+        n   = g.vcount()
+
+        self.exact   = samples >= n
+        self.sources = np.arange(n) if self.exact else rng.choice(n, size=samples, replace=False)
+        self.out     = np.array(g.distances(source=self.sources.tolist(), mode='out'), dtype=float)
+        self.inc     = np.array(g.distances(source=self.sources.tolist(), mode='in'), dtype=float)
+
+        # double sweep: from the farthest vertex each source reaches, the
+        # distance of the farthest vertex that reaches it (another lower bound)
+        finite_out = np.where(np.isfinite(self.out), self.out, -1)
+        farthest   = np.unique(finite_out.argmax(axis=1))
+        self.sweep = np.array(g.distances(source=farthest.tolist(), mode='in'), dtype=float)
+
+    def diameter(self) -> float:
+        # a lower bound (every value is the distance between two vertices)
+        return float(max(
+            self.out[np.isfinite(self.out)].max(initial=0),
+            self.sweep[np.isfinite(self.sweep)].max(initial=0)
+        ))
+
+    def diameter_upper_bound(self) -> float:
+        # d(x, y) <= d(x, v) + d(v, y) for every source v, but only if all
+        # vertices reach and are reached by v (otherwise it is unknown)
+        if self.exact:
+            return self.diameter()
+        ecc = self.out.max(axis=1) + self.inc.max(axis=1)
+        return float(ecc.min()) if np.isfinite(ecc).any() else np.nan
+
+    def path_length(self) -> float:
+        finite = np.isfinite(self.out) & (self.out > 0)
+        return float(self.out[finite].mean()) if finite.any() else np.nan
+
+    def path_length_error(self) -> float:
+        if self.exact:
+            return 0.0
+        finite = np.isfinite(self.out) & (self.out > 0)
+        counts = finite.sum(axis=1)
+        means  = np.where(finite, self.out, 0).sum(axis=1)[counts > 0] / counts[counts > 0]
+        if len(means) < 2:
+            return np.nan
+        return float(1.96 * means.std(ddof=1) / np.sqrt(len(means)))
+
+# sampled distances of the last graph (every approximation of a graph is
+# calculated by the same worker, one after the other)
+_last_sampled : tuple[Graph, int, SampledDistances] | None = None
+
+def sampled_distances(g : Graph, samples : int) -> SampledDistances:
+    global _last_sampled
+    if _last_sampled is None or _last_sampled[0] is not g or _last_sampled[1] != samples:
+        _last_sampled = (g, samples, SampledDistances(g, samples))
+    return _last_sampled[2]
+
+def approx_metric(g : Graph, name : str) -> float:
+    metric, _, rest  = name.partition('@')
+    samples, _, part = rest.partition(':')
+    dists = sampled_distances(g, int(samples))
+
+    if metric == 'diameter' and part == '':
+        return dists.diameter()
+    elif metric == 'diameter' and part == 'high':
+        return dists.diameter_upper_bound()
+    elif metric == 'path-length' and part == '':
+        return dists.path_length()
+    elif metric == 'path-length' and part == 'err':
+        return dists.path_length_error()
+    else:
+        raise Exception(f'Invalid graph metric "{name}"')
+
+def approx_metrics(metric : str, samples : int) -> list[str]:
+    """
+    Names of the approximation of `metric` and of its error bound.
+    """
+    assert metric in APPROX_METRICS, f'no approximation of "{metric}"'
+    bound = 'high' if metric == 'diameter' else 'err'
+    return [f'{metric}@{samples}', f'{metric}@{samples}:{bound}']
+
+# file where the calculated metrics are kept between runs
+METRICS_CACHE = '.metrics-cache.pkl'
+
+# (exp-id, snapshot-nr, metric) -> (edges hash, value)
+type MetricsCache = dict[tuple[int, int, str], tuple[str, float]]
+
+def edges_hash(g : Graph) -> str:
+    """
+    Hash of the graph vertices and edges, when the snapshots data changes so
+    does the hash and the cached metrics of the graph are discarded.
+    """
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64)
+    sign  = hashlib.sha1(f'{g.vcount()}:{int(g.is_directed())}:'.encode())
+    sign.update(edges.tobytes())
+    return sign.hexdigest()
+
+def load_metrics_cache(filename : str) -> MetricsCache:
+    try:
+        with open(filename, 'rb') as file:
+            return pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return {}
+
+def save_metrics_cache(filename : str, cache : MetricsCache):
+    with open(f'{filename}.tmp', 'wb') as file:
+        pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{filename}.tmp', filename)
+
+def calc_metrics(g : Graph, metrics : list[str]) -> list[float]:
+    return [
+        GRAPH_METRICS[name](g) if name in GRAPH_METRICS else approx_metric(g, name)
+            for name in metrics
+    ]
+
+def _calc_metrics_task(task : tuple[Graph, list[str]]) -> list[float]:
+    return calc_metrics(*task)
+
+@profiling.stage
+def calc_graph_metrics(
+        graphs     : ExpGraphs,
+        metrics    : list[str],
+        jobs       : int | None = None,
+        cache_file : str | None = METRICS_CACHE
+    ) -> pd.DataFrame:
+    """
+    Calculates every metric of every snapshot graph (all of a graph metrics
+    are calculated by the same worker) using a pool of `jobs` processes
+    (default: the number of cpus). Metrics already in `cache_file` for the
+    same graph (see edges_hash) are not calculated again. Returns a table
+    with the columns: experiment (label), exp-id, snapshot-nr, metric and value.
+    """
+    cache = load_metrics_cache(cache_file) if cache_file is not None else {}
+
+    # (label, exp-id, snapshot-nr) of every graph
+    keys  = []
+    tasks = []
+    for label, exp_graphs in graphs.items():
+        for exp_id, snaps_graphs in exp_graphs.items():
+            for snap_nr, g in enumerate(snaps_graphs):
+                if g is None: continue
+                sign    = edges_hash(g)
+                missing = [
+                    name for name in metrics 
+                        if cache.get((exp_id, snap_nr, name), ('', 0))[0] != sign
+                ]
+                keys.append((label, exp_id, snap_nr))
+                if len(missing) > 0:
+                    tasks.append(((exp_id, snap_nr, sign), (g, missing)))
+
+    jobs = jobs if jobs is not None else os.cpu_count() or 1
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(
+                _calc_metrics_task, [task for _, task in tasks], 
+                chunksize=max(1, len(tasks) // (4 * jobs))
+            ))
+    else:
+        results = [_calc_metrics_task(task) for _, task in tasks]
+
+    for ((exp_id, snap_nr, sign), (_, missing)), values in zip(tasks, results):
+        for name, value in zip(missing, values):
+            cache[(exp_id, snap_nr, name)] = (sign, value)
+
+    if cache_file is not None and len(tasks) > 0:
+        save_metrics_cache(cache_file, cache)
+
+    rows = [
+        (label, exp_id, snap_nr, name, cache[(exp_id, snap_nr, name)][1])
+            for label, exp_id, snap_nr in keys
+                for name in metrics
+    ]
+    return pd.DataFrame(
+        rows, columns=np.array([gm.EXPERIMENT, gm.EXP_ID, gm.SNAPSHOT_NR, gm.METRIC, gm.VALUE])
+    )
@@ -0,0 +1,72 @@
+import pandas as pd
+
+import profiling
+from sketch import DDSketch, DEFAULT_ALPHA
+from time_series import percentile_column
+from utils import Lookups as lk
+from utils import Publishes as pb
+
+from collections.abc import Iterable
+
+# Latency distributions of the look-ups (resolve time) and of the publishes
+# (duration), as one mergeable sketch (see sketch.py) per group of operations,
+# e.g. per (peer dht, cid type, experiment). The sketches of a group computed
+# from different tables (e.g. the partitions of each experiment) are merged,
+# so the distributions never need every sample at once.
+
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+LOOKUP_KEYS  = [lk.PEER_DHT, lk.CID_TYPE, lk.EXP_ID]
+PUBLISH_KEYS = [pb.SRC_DHT, pb.EXP_ID]
+
+# sketch of each group (by the values of its keys)
+Sketches = dict[tuple, DDSketch]
+
+@profiling.stage
+def calc_sketches(data : pd.DataFrame, latency : str, keys : list[str], alpha : float = DEFAULT_ALPHA) -> Sketches:
+    return {
+        key : DDSketch(alpha).add(values.to_numpy())
+            for key, values in data.groupby(keys, observed=True)[latency]
+    }
+
+def calc_lookup_sketches(lookups : pd.DataFrame, alpha : float = DEFAULT_ALPHA) -> Sketches:
+    # only the resolved ones (like the average resolve time)
+    resolved = lookups[lookups[lk.PROVIDERS] > 0]
+    return calc_sketches(resolved, lk.LOOKUP_TIME, LOOKUP_KEYS, alpha) # type: ignore
+
+def calc_publish_sketches(publishes : pd.DataFrame, alpha : float = DEFAULT_ALPHA) -> Sketches:
+    # one row per storage node of each publish
+    publishes = publishes.drop_duplicates([pb.EXP_ID, pb.SRC_PID, pb.CID])
+    return calc_sketches(publishes, pb.DURATION, PUBLISH_KEYS, alpha)
+
+def merge_sketches(all_sketches : Iterable[Sketches]) -> Sketches:
+    merged : Sketches = {}
+    for sketches in all_sketches:
+        for key, sketch in sketches.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = DDSketch(sketch.alpha).merge(sketch)
+    return merged
+
+def regroup_sketches(sketches : Sketches, keys : list[str], by : list[str]) -> Sketches:
+    """
+    Merges the sketches of the groups with the same values of the `by` keys
+    (e.g. the experiments of each dht type), `keys` are the current ones.
+    """
+    positions = [keys.index(key) for key in by]
+    return merge_sketches(
+        {tuple(key[i] for i in positions) : sketch} for key, sketch in sketches.items()
+    )
+
+def calc_latency_quantiles(sketches : Sketches, keys : list[str], quantiles : list[float] = QUANTILES) -> pd.DataFrame:
+    """
+    The count, mean and quantiles (as percentile columns, e.g. p99.9) of
+    each group, indexed by its keys.
+    """
+    rows = [
+        [*key, sketch.count, sketch.mean(), *sketch.quantiles(quantiles)]
+            for key, sketch in sorted(sketches.items())
+    ]
+    columns = [*keys, 'count', 'mean', *(percentile_column(q * 100) for q in quantiles)]
+    return pd.DataFrame(rows, columns=columns).set_index(keys)
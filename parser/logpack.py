@@ -0,0 +1,291 @@
+#! /usr/bin/env python3
+
+import argparse
+import fnmatch
+import functools
+import glob
+import gzip
+import io
+import json
+import logging as log
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections.abc import Iterator
+from typing import IO, NamedTuple
+
+# Single file archive of the logs of an experiment (see get-logs in
+# scripts/script.sh). Each log file is a gzip member of its own and a table of
+# contents (TOC) at the end of the archive keeps the offset of each member, so
+# the parser reads any node's logs straight from it (`<archive>/<log file>`
+# paths, see open_log and glob_logs) without extracting the archive. The files
+# are read and compressed by a pool of threads while the compressed ones are
+# written, zlib releases the GIL so they really run in parallel. Each member is
+# compressed into a temporary file (next to the archive) and then copied into
+# it, so only a chunk per thread is ever in memory.
+#
+# Layout: MAGIC, the members (in no particular order), the TOC (gzipped json,
+# the members in the order the directory listed them) and TRAILER (offset and
+# length of the TOC and MAGIC again). `gzip -dc` of a member's bytes gives the
+# original file back.
+
+EXTENSION = '.logpack'
+VERSION   = 1
+MAGIC     = b'LOGPACK1'
+TRAILER   = struct.Struct(f'<QQ{len(MAGIC)}s')
+
+# files are read (and compressed) by chunks of this size
+CHUNK_SIZE = 1 << 20
+
+COMPRESS_LEVEL = 6
+
+class Member(NamedTuple):
+    offset : int
+    length : int # compressed
+    size   : int # original
+
+class MemberReader(io.RawIOBase):
+    """
+    The original bytes of a member, read from the archive (and decompressed)
+    by chunks as they are needed, so a member is never in memory as a whole.
+    """
+    def __init__(self, filename : str, member : Member):
+        self.file = open(filename, 'rb')
+        self.file.seek(member.offset)
+        self.left         = member.length  # compressed bytes not read yet
+        self.compressed   = b''            # read but not decompressed yet
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if len(self.compressed) == 0 and self.left > 0:
+                self.compressed = self.file.read(min(CHUNK_SIZE, self.left))
+                if len(self.compressed) == 0:
+                    raise EOFError(f'{self.file.name} is truncated')
+                self.left -= len(self.compressed)
+            data = self.decompressor.decompress(self.compressed, len(buffer))
+            self.compressed = self.decompressor.unconsumed_tail
+            if len(data) > 0 or (len(self.compressed) == 0 and self.left == 0):
+                break
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+class LogPack:
+    def __init__(self, filename : str):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            file.seek(-TRAILER.size, os.SEEK_END)
+            toc_offset, toc_length, magic = TRAILER.unpack(file.read(TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError(f'{filename} is not a logs archive')
+            file.seek(toc_offset)
+            toc = json.loads(gzip.decompress(file.read(toc_length)))
+
+        assert toc['version'] == VERSION, f'unsupported archive version {toc["version"]}'
+        self.members = {name : Member(*entry) for name, entry in toc['members'].items()}
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, name : str) -> bool:
+        return name in self.members
+
+    def names(self) -> list[str]:
+        return list(self.members)
+
+    def member(self, name : str) -> Member:
+        if name not in self.members:
+            raise FileNotFoundError(f'{self.filename}/{name}')
+        return self.members[name]
+
+    def open(self, name : str, binary : bool = False) -> IO:
+        data = io.BufferedReader(MemberReader(self.filename, self.member(name)), CHUNK_SIZE)
+        return data if binary else io.TextIOWrapper(data)
+
+    def iter_chunks(self, name : str) -> Iterator[bytes]:
+        """ The original bytes of a member, by chunks of up to CHUNK_SIZE. """
+        with MemberReader(self.filename, self.member(name)) as reader:
+            while chunk := reader.read(CHUNK_SIZE):
+                yield chunk
+
+@functools.lru_cache(maxsize=None)
+def load_archive(filename : str) -> LogPack:
+    return LogPack(filename)
+
+def is_archive(path : str) -> bool:
+    return path.endswith(EXTENSION) and os.path.isfile(path)
+
+def in_archive(path : str) -> bool:
+    return is_archive(os.path.dirname(path))
+
+def open_log(path : str, binary : bool = False) -> IO:
+    """ Opens a log file, either a file or the member of an archive. """
+    archive, name = os.path.split(path)
+    if is_archive(archive):
+        return load_archive(archive).open(name, binary)
+    return open(path, 'rb' if binary else 'r')
+
+def log_exists(path : str) -> bool:
+    archive, name = os.path.split(path)
+    if is_archive(archive):
+        return name in load_archive(archive)
+    return os.path.isfile(path)
+
+def iter_log_chunks(path : str) -> Iterator[bytes]:
+    """ The bytes of a log file (or archive member) by chunks. """
+    archive, name = os.path.split(path)
+    if is_archive(archive):
+        yield from load_archive(archive).iter_chunks(name)
+        return
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+def glob_logs(pattern : str) -> list[str]:
+    """
+    Like glob.glob, but the pattern may be in an archive as well (only the
+    file name, e.g. `<archive>/*.info`).
+    """
+    archive, name = os.path.split(pattern)
+    if is_archive(archive):
+        return [f'{archive}/{member}' for member in fnmatch.filter(load_archive(archive).names(), name)]
+    return glob.glob(pattern)
+
+def compress_file(filename : str, level : int = COMPRESS_LEVEL, tmp_dir : str | None = None) -> tuple[IO[bytes], int]:
+    """
+    The gzip member of a file, in a temporary file (in tmp_dir, rewound and
+    removed once it is closed), and the size of the file.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    member, size = tempfile.TemporaryFile(dir=tmp_dir), 0
+    try:
+        with open(filename, 'rb') as file:
+            while block := file.read(CHUNK_SIZE):
+                size += len(block)
+                member.write(compressor.compress(block))
+        member.write(compressor.flush())
+        member.seek(0)
+    except BaseException:
+        member.close()
+        raise
+    return member, size
+
+def pack(dirname : str, filename : str, jobs : int = 8, level : int = COMPRESS_LEVEL) -> LogPack:
+    """
+    Packs the files of dirname into the archive filename (written to a
+    temporary file first, so an interrupted run never leaves a broken one).
+    """
+    with os.scandir(dirname) as entries:
+        names = [entry.name for entry in entries if entry.is_file()]
+
+    members : dict[str, Member] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool, open(f'{filename}.tmp', 'wb') as out:
+        out.write(MAGIC)
+
+        def write(done : set[Future]):
+            for future in done:
+                name, (member, size) = futures.pop(future), future.result()
+                with member:
+                    offset = out.tell()
+                    shutil.copyfileobj(member, out, CHUNK_SIZE)
+                members[name] = Member(offset, out.tell() - offset, size)
+
+        # at most 2 files per thread are compressed (and kept in temporary
+        # files) at once
+        tmp_dir = os.path.dirname(os.path.abspath(filename))
+        futures : dict[Future, str] = {}
+        for name in names:
+            if len(futures) >= 2 * jobs:
+                write(wait(futures, return_when=FIRST_COMPLETED).done)
+            futures[pool.submit(compress_file, f'{dirname}/{name}', level, tmp_dir)] = name
+        write(wait(futures).done)
+
+        toc = gzip.compress(json.dumps({
+            'version' : VERSION,
+            'members' : {name : members[name] for name in names},
+        }).encode())
+        toc_offset = out.tell()
+        out.write(toc)
+        out.write(TRAILER.pack(toc_offset, len(toc), MAGIC))
+
+    os.replace(f'{filename}.tmp', filename)
+    return LogPack(filename)
+
+def extract(archive : LogPack, dirname : str, names : list[str] | None = None, jobs : int = 8):
+    os.makedirs(dirname, exist_ok=True)
+
+    def extract_member(name : str):
+        with archive.open(name, binary=True) as member, open(f'{dirname}/{name}', 'wb') as file:
+            shutil.copyfileobj(member, file, CHUNK_SIZE)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(extract_member, names if names else archive.names()))
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Packs the logs of an experiment into a single compressed archive (which main.py reads as it is).'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pack_cmd = commands.add_parser('pack', help='packs the files of a directory')
+    pack_cmd.add_argument('directory', help='experiment logs directory')
+    pack_cmd.add_argument('archive', help=f'archive file (usually with a {EXTENSION} extension)')
+    pack_cmd.add_argument(
+        '-j', '--jobs', type=int, default=8, metavar='N', help='number of threads compressing the files (default: 8)'
+    )
+    pack_cmd.add_argument(
+        '--level', type=int, default=COMPRESS_LEVEL, choices=range(1, 10), metavar='1-9',
+        help=f'gzip compression level (default: {COMPRESS_LEVEL})'
+    )
+    pack_cmd.add_argument('--remove', action='store_true', help='removes the directory once it is packed')
+
+    list_cmd = commands.add_parser('list', help='lists the files of an archive')
+    list_cmd.add_argument('archive')
+
+    extract_cmd = commands.add_parser('extract', help='extracts (some of) the files of an archive')
+    extract_cmd.add_argument('archive')
+    extract_cmd.add_argument('directory')
+    extract_cmd.add_argument('names', nargs='*', metavar='name', help='files to extract (default: all)')
+    extract_cmd.add_argument(
+        '-j', '--jobs', type=int, default=8, metavar='N', help='number of threads extracting the files (default: 8)'
+    )
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    opts = parse_args(args)
+    log.basicConfig(level=log.INFO, format="%(levelname)s: %(message)s")
+
+    if opts.command == 'pack':
+        archive = pack(opts.directory, opts.archive, opts.jobs, opts.level)
+        size    = sum(member.size for member in archive.members.values())
+        log.info(
+            "packed %d files (%.1f MB) into %s (%.1f MB)",
+            len(archive), size / 2**20, opts.archive, os.path.getsize(opts.archive) / 2**20
+        )
+        if opts.remove:
+            for name in archive.names():
+                os.remove(f'{opts.directory}/{name}')
+            os.rmdir(opts.directory)
+
+    elif opts.command == 'list':
+        archive = LogPack(opts.archive)
+        for name, member in archive.members.items():
+            print(f'{member.size:>12} {member.length:>12} {name}')
+
+    else:
+        extract(LogPack(opts.archive), opts.directory, opts.names, opts.jobs)
+
+if __name__ == '__main__':
+    main(sys.argv)
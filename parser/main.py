@@ -3,12 +3,12 @@
 from enum import Enum
 import sys
 import glob
-import json
 import logging as log
 import pandas as pd
 import numpy  as np
 import os
-import re
+import mmap
+import argparse
 
 
 # from utils import Headers as hd
@@ -16,34 +16,50 @@ from utils import Headers as hd
 from utils import Lookups as lk
 from utils import Snapshots as sp 
 from utils import Publishes as pv
-
-from typing import TypedDict
-from collections.abc import Iterator
+from utils import Peers as pr
+from utils import Cids as cd
+from utils import RtCube as rc
+from cache import CACHE_DIR, dir_signature, load_cached, save_cached
+from decoders import PublishFields
+from rt_cube import calc_rt_cube
+from summary import Summary, SUMMARY_FILE
+import decoders
+import logpack
+import profiling
+
+from typing import TypedDict, NamedTuple
+from collections.abc import Iterator, Iterable
+from concurrent.futures import ProcessPoolExecutor
 
 # import pprint as pp
 from datetime import datetime as dt
+from dateutil.tz import tzlocal
 
 # format for lookup timestamps
 DATE_TIME_FMT = '%Y/%m/%d %H:%M:%S'
 
-# snapshots regular expression
-SNAPSHOTS_RE = re.compile('xxx-start-xxx([^"]+?)xxx-end-xxx')
+# snapshots delimiters
+SNAP_START = 'xxx-start-xxx'
+SNAP_END   = 'xxx-end-xxx'
 
 # bucket number and peers_id
 Bucket   = list[str]
 Snapshot = list[Bucket]
 
-class LookupRecord (TypedDict):
-    cid       : str
-    time_ms   : float
-    type      : str
-    providers : list[str]
-    queries   : list[str]
-    timestamp : int
+# the lookup records of a node, one list per field (providers and queries
+# are replaced by their lengths)
+class LookupColumns(TypedDict):
+    cid       : list[str]
+    time_ms   : list[float]
+    type      : list[str]
+    providers : list[int]
+    queries   : list[int]
+    timestamp : np.ndarray
 
 class NodeInfo(TypedDict):
     id   : str
     mode : str
+    role : str
     
 class PublishRecord(TypedDict):
     cid       : str
@@ -77,60 +93,207 @@ class DhtType(Enum):
         else:
             raise Exception(f'Invalid dht type "{value}"')
 
+@profiling.stage
 def load_cids(filename : str) -> list[str]:
-    with open(filename) as file:
+    with logpack.open_log(filename) as file:
         data = file.read()
-        return json.loads( data.split(maxsplit=2)[-1] )
+        return decoders.loads( data.split(maxsplit=2)[-1] )
         # return [ info['Content'] for info in infos ] #json.loads(aux[-1]) ]
 
-def str_to_unix_time( time : str ) -> int:
-    real_time = dt.strptime(time, DATE_TIME_FMT)
-    return int( real_time.timestamp() )
-
-def load_look_up_times(filename : str) -> list[LookupRecord]: #list[dict[str, str]]:
-    times = []
-    with open(filename) as file:
-        for line in file.readlines():
+@profiling.stage
+def str_to_unix_times( times : list[str] ) -> np.ndarray:
+    """
+    Same as datetime.strptime(time, DATE_TIME_FMT).timestamp() (so local
+    times) for each time, but each distinct time is only converted once,
+    and all of them by a single pd.to_datetime call.
+    """
+    codes, uniques = pd.factorize(np.asarray(times, dtype=object))
+    wall_times = pd.to_datetime(uniques, format=DATE_TIME_FMT)
+    real_times = wall_times.tz_localize(
+        # like datetime, repeated times (DST end) are taken as the first ones
+        tzlocal(), ambiguous=np.ones(len(uniques), dtype=bool), nonexistent='NaT'
+    )
+    seconds = real_times.as_unit('s').asi8.copy()
+
+    # times skipped by the DST start (which do not convert back to the same
+    # wall time) are rare, so they are left to datetime
+    invalid = real_times.isna() | (real_times.tz_localize(None) != wall_times)
+    for i in np.flatnonzero(invalid):
+        seconds[i] = int( dt.strptime(uniques[i], DATE_TIME_FMT).timestamp() )
+
+    return seconds[codes]
+
+@profiling.stage
+def load_look_up_times(filename : str) -> LookupColumns:
+    times : LookupColumns = {
+        'cid' : [], 'time_ms' : [], 'type' : [], 'providers' : [], 'queries' : [], 
+        'timestamp' : np.empty(0, dtype=np.int64)
+    }
+    dates = []
+    with logpack.open_log(filename) as file:
+        for line in file:
             values = line.split(maxsplit=2)
-            lookup_rec = json.loads(values[-1])
-            timestamp  = str_to_unix_time(' '.join(values[:-1]))
+            cid, time_ms, rec_type, providers, queries = decoders.decode_lookup(values[-1])
+            dates.append(' '.join(values[:-1]))
 
-            lookup_rec['timestamp'] = timestamp
-            times.append(
-                lookup_rec
-            )
+            times['cid'].append(cid)
+            times['time_ms'].append(time_ms)
+            times['type'].append(rec_type)
+            times['providers'].append(providers)
+            times['queries'].append(queries)
 
-        return times
+    if len(dates) > 0:
+        times['timestamp'] = str_to_unix_times(dates)
+    return times
 
+@profiling.stage
 def load_node_info(filename : str) -> NodeInfo:
-    with open(filename) as file:
-        return json.loads(file.read())
+    with logpack.open_log(filename) as file:
+        return decoders.loads(file.read())
+
+def iter_snapshot_blocks(lines : Iterable[str]) -> Iterator[str]:
+    """
+    Yields the text between each SNAP_START and the following SNAP_END,
+    reading one line at a time. Like the regex it replaces
+    ('xxx-start-xxx([^"]+?)xxx-end-xxx'), blocks with a quote in them are
+    discarded, so only the snapshot being read is kept in memory.
+    """
+    buffer = ''  # text from the last (unmatched) start marker on
+    seen   = 0   # buffer prefix already checked for end markers and quotes
+    for line in lines:
+        if buffer:
+            buffer += line
+        else:
+            start = line.find(SNAP_START)
+            if start < 0: continue
+            buffer, seen = line[start:], len(SNAP_START)
+
+        while buffer:
+            end   = buffer.find(SNAP_END, max(seen, len(SNAP_START) + 1))
+            quote = buffer.find('"', seen, end if end >= 0 else len(buffer))
+
+            if quote >= 0:
+                # the block is invalid, try the next start marker (if any)
+                start  = buffer.find(SNAP_START, 1)
+                buffer = buffer[start:] if start >= 0 else ''
+                seen   = len(SNAP_START)
+                continue
+
+            if end < 0:
+                # markers never span lines so there is no need to check it again
+                seen = len(buffer)
+                break
+
+            yield buffer[len(SNAP_START):end]
+
+            buffer = buffer[end + len(SNAP_END):]
+            start  = buffer.find(SNAP_START)
+            buffer = buffer[start:] if start >= 0 else ''
+            seen   = len(SNAP_START)
+
+def parse_snapshot(info : str) -> Snapshot:
+    snapshot = []
+    for bucket in info.split('bucket:')[1:]:
+        lines = bucket.strip().splitlines()
+        snapshot.append([
+            # lines[0] is the bucket number :)
+            line.split(' ', maxsplit=2)[1] for line in lines[1:]
+        ])
+    return snapshot
+
+def iter_mapped_snapshot_blocks(filename : str) -> Iterator[str]:
+    """
+    Same as iter_snapshot_blocks but the file is memory mapped and the markers
+    are found with bytes.find, so only the snapshots are ever copied (and
+    decoded) out of the file. The files in an archive are decompressed and
+    searched by chunks (see iter_chunked_snapshot_blocks), files that cannot
+    be mapped are read by lines.
+    """
+    if logpack.in_archive(filename):
+        yield from iter_chunked_snapshot_blocks(logpack.iter_log_chunks(filename))
+        return
+
+    with open(filename, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return # empty file
+        except OSError:
+            with open(filename) as text:
+                yield from iter_snapshot_blocks(text)
+            return
+
+    with data:
+        yield from iter_buffer_snapshot_blocks(data)
+
+def iter_buffer_snapshot_blocks(data : bytes | mmap.mmap) -> Iterator[str]:
+    start, end_marker = SNAP_START.encode(), SNAP_END.encode()
+    pos = data.find(start)
+    while pos >= 0:
+        begin = pos + len(start)
+        end   = data.find(end_marker, begin + 1)
+        if end < 0:
+            break # no snapshot can end after this point
+
+        # like the regex, a quote invalidates this start marker
+        if data.find(b'"', begin, end) >= 0:
+            pos = data.find(start, pos + 1)
+            continue
+
+        yield data[begin:end].decode()
+        pos = data.find(start, end + len(end_marker))
+
+def iter_chunked_snapshot_blocks(chunks : Iterable[bytes]) -> Iterator[str]:
+    """
+    Same as iter_buffer_snapshot_blocks over the concatenation of chunks, but
+    only the bytes from the last unmatched start marker on are kept.
+    """
+    start, end_marker = SNAP_START.encode(), SNAP_END.encode()
+    buffer = b''
+    search = 0   # where the next start marker can be
+    for chunk in chunks:
+        buffer += chunk
+        pos = buffer.find(start, search)
+        while pos >= 0:
+            begin = pos + len(start)
+            end   = buffer.find(end_marker, begin + 1)
+            if end < 0:
+                break # it might end in the next chunks
+
+            # like the regex, a quote invalidates this start marker
+            if buffer.find(b'"', begin, end) >= 0:
+                search = pos + 1
+            else:
+                yield buffer[begin:end].decode()
+                search = end + len(end_marker)
+            pos = buffer.find(start, search)
+
+        # only what a start marker can still be found in
+        keep   = pos if pos >= 0 else max(search, len(buffer) - len(start) + 1)
+        buffer = buffer[keep:]
+        search = 0
 
+@profiling.stage
 def load_snapshots(filename : str) -> Iterator[Snapshot]:
-    with open(filename) as file:
-        data = file.read()
-        for snap_data in SNAPSHOTS_RE.finditer(data):
-            snapshot = []
-            info = snap_data.group(1)
-            for bucket in info.split('bucket:')[1:]:
-                lines = bucket.strip().splitlines()
-                snapshot.append([
-                    # lines[0] is the bucket number :)
-                    line.split(' ', maxsplit=2)[1] for line in lines[1:]
-                ])
-            yield snapshot
-
-
-def load_provides_record(prefix : str) -> list[PublishRecord]:
-    publish : dict[str, PublishRecord] = {}
-    with open(f'{prefix}-publish.log') as file:
+    for info in iter_mapped_snapshot_blocks(filename):
+        yield parse_snapshot(info)
+
+
+# (cid, time_ms, queries-nr, store_nodes, timestamp) of each PublishRecord
+TimedPublish = tuple[str, float, int, list[str], int]
+
+@profiling.stage
+def load_provides_record(prefix : str) -> list[TimedPublish]:
+    publish : dict[str, PublishFields] = {}
+    dates   : list[str] = []
+    with logpack.open_log(f'{prefix}-publish.log') as file:
         for line in file:
-            res : PublishRecord = json.loads(
-                line.split(' ', maxsplit=2)[-1]
-            )
-            
-            assert not (res['cid'] in publish)
-            publish[res['cid']] = res
+            values = line.split(' ', maxsplit=2)
+            res    = decoders.decode_publish(values[-1])
+
+            assert not (res[0] in publish)
+            publish[res[0]] = res
+            dates.append(' '.join(values[:-1]))
     # with open(f'{prefix}-provide.log') as file:
     #     for line in file:
     #         res =json.loads(
@@ -145,163 +308,345 @@ def load_provides_record(prefix : str) -> list[PublishRecord]:
             # res : ProvideRecord = json.loads(
             #     line.split(' ', maxsplit=2)[-1]
             # )
-    return list(publish.values())
+    times = str_to_unix_times(dates).tolist() if len(dates) > 0 else []
+    return [(*record, timestamp) for record, timestamp in zip(publish.values(), times)]
 
     
 
     
-class Node:
-    def __init__(self, pid : str, dht_type : DhtType):
-        self.pid = pid
-        self.dht_type = dht_type
+# dht types of the tables columns (the categories are sorted so that the
+# charts keep the same order they have with csv files)
+DHT_CATEGORY = pd.CategoricalDtype(sorted(dht.name for dht in DhtType))
+
+def dht_codes(names : Iterable[str]) -> np.ndarray:
+    """
+    DHT_CATEGORY codes of dht types names (any case, see DhtType.parse_from),
+    each distinct name is only parsed once.
+    """
+    codes, uniques = pd.factorize(np.asarray(list(names), dtype=object))
+    categories = DHT_CATEGORY.categories.get_indexer(
+        [DhtType.parse_from(name).name for name in uniques]
+    )
+    return categories.astype(np.int8)[codes]
+
+class ExperimentIndex:
+    """
+    Peers and CIDs of an experiment directory, that is, everything each
+    node's logs need to be turned into table rows. It is built once per
+    directory (see load_nodes) and maps whole arrays of peers ids or cids
+    to their position (their id in the peers and cids tables), dht type
+    and owner at once.
+    """
+    def __init__(self, dirname : str):
+        self.dirname    = dirname
+        self.pids       = pd.Index([], dtype=object)  # alive nodes, in the order they were loaded
+        self.dhts       = np.empty(0, dtype=np.int8)  # DHT_CATEGORY code of each node
+        self.roles      : list[str] = []
+        self.cids       = pd.Index([], dtype=object)
+        self.cids_owner = np.empty(0, dtype=np.int32) # node (position in pids) that published each cid
+        self.failed     = pd.Index([], dtype=object)  # nodes without a cids log
+
+    def load_nodes(self):
+        # TODO: add loading bar :)
+        # loads each node info (which is made of <node-id> and <dht-type> )
+        pids, dhts, roles, failed = [], [], [], []
+        # a cid in the logs of several nodes keeps its first position and its last owner
+        cids_owner : dict[str, str] = {}
+        for info_file in logpack.glob_logs('{}/*.info'.format(self.dirname)):
+            info    = load_node_info(info_file)
+            peer_id = info['id']
+            dht     = DhtType.parse_from(info['mode'])
+            try:
+                cids = load_cids(f'{self.dirname}/{peer_id}-cids.log')
+            except FileNotFoundError:
+                # log.warning("Node %s failed during experiment, removing it...", peer_id)
+                failed.append(peer_id)
+                continue
 
-    def get_pid(self) -> str:
-        return self.pid
+            pids.append(peer_id)
+            dhts.append(dht.name)
+            roles.append(info.get('role', ''))
+            cids_owner.update(dict.fromkeys(cids, peer_id))
+
+        self.pids       = pd.Index(pids, dtype=object)
+        self.dhts       = dht_codes(dhts)
+        self.roles      = roles
+        self.cids       = pd.Index(list(cids_owner.keys()), dtype=object)
+        self.cids_owner = self.pid_codes(list(cids_owner.values()))
+        self.failed     = pd.Index(failed, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.pids)
+
+    def pid_codes(self, pids) -> np.ndarray:
+        """ Position of each peer id (-1 for the unknown and failed ones). """
+        return self.pids.get_indexer(pids).astype(np.int32)
+
+    def cid_codes(self, cids) -> np.ndarray:
+        """ Position of each cid (-1 for the ones no node published). """
+        return self.cids.get_indexer(cids).astype(np.int32)
+
+    def is_failed(self, pids) -> np.ndarray:
+        return self.failed.get_indexer(pids) >= 0
+
+    def node_dhts(self, codes : np.ndarray) -> np.ndarray:
+        """ Dht type code of the nodes at each position (-1 for -1). """
+        dhts  = np.full(len(codes), -1, dtype=np.int8)
+        known = codes >= 0
+        dhts[known] = self.dhts[codes[known]]
+        return dhts
+
+    def cid_dhts(self, codes : np.ndarray) -> np.ndarray:
+        """ Dht type code of the owner of the cids at each position. """
+        return self.node_dhts(self.cids_owner[codes])
+
+# one array per column of a table (the dht types as DHT_CATEGORY codes)
+Columns = list[np.ndarray]
+
+# the piece of the look-ups, snapshots and publishes tables of a single node
+class NodeChunk:
+    def __init__(self, lookups : Columns, snapshots : Columns, publishes : Columns, useless_cids : set[str]):
+        self.lookups      = lookups
+        self.snapshots    = snapshots
+        self.publishes    = publishes
+        self.useless_cids = useless_cids
+        # stages records of the worker process that parsed the node (if profiling)
+        self.profile : list[profiling.StageRecord] = []
+
+    def __len__(self) -> int:
+        return sum(len(table[0]) for table in [self.lookups, self.snapshots, self.publishes])
+
+LOOKUPS_COLUMNS   = [lk.TS, lk.PID, lk.PEER_DHT, lk.CID, lk.CID_TYPE, lk.LOOKUP_TIME, lk.PROVIDERS, lk.QUERIES]
+SNAPSHOTS_COLUMNS = [sp.SRC_PID, sp.SRC_DHT, sp.DST_PID, sp.DST_DHT, sp.SNAPSHOT_NR, sp.BUCKET_NR]
+PUBLISHES_COLUMNS = [pv.CID, pv.SRC_PID, pv.SRC_DHT, pv.QUERIES_NR, pv.DURATION, pv.STORAGE_NODE, pv.STORAGE_DHT, pv.TS]
+
+# column types of the tables saved as parquet files
+LOOKUPS_TYPES = {
+    lk.TS : 'int64', lk.PID : 'int32', lk.CID : 'int32', lk.PEER_DHT : DHT_CATEGORY, lk.CID_TYPE : DHT_CATEGORY, lk.LOOKUP_TIME : 'float32',
+    lk.PROVIDERS : 'int32', lk.QUERIES : 'int32', lk.EXP_ID : 'int32'
+}
+SNAPSHOTS_TYPES = {
+    sp.SRC_PID : 'int32', sp.DST_PID : 'int32', sp.SRC_DHT : DHT_CATEGORY, sp.DST_DHT : DHT_CATEGORY, sp.SNAPSHOT_NR : 'int32',
+    sp.BUCKET_NR : 'int32', sp.EXP_ID : 'int32'
+}
+PUBLISHES_TYPES = {
+    pv.CID : 'int32', pv.SRC_PID : 'int32', pv.STORAGE_NODE : 'int32', pv.SRC_DHT : DHT_CATEGORY, pv.QUERIES_NR : 'int32', pv.DURATION : 'float32',
+    pv.STORAGE_DHT : DHT_CATEGORY, pv.TS : 'int64', pv.EXP_ID : 'int32'
+}
+PEERS_TYPES = {
+    pr.IDX : 'int32', pr.DHT : DHT_CATEGORY, pr.EXP_ID : 'int32'
+}
+CIDS_TYPES = {
+    cd.IDX : 'int32', cd.OWNER : 'int32', cd.TYPE : DHT_CATEGORY, cd.EXP_ID : 'int32'
+}
+RT_CUBE_TYPES = {
+    rc.SRC_PID : 'int32', rc.SRC_DHT : DHT_CATEGORY, rc.SNAPSHOT_NR : 'int32', rc.BUCKET_NR : 'int32',
+    rc.DST_DHT : DHT_CATEGORY, rc.COUNT : 'int32', rc.EXP_ID : 'int32'
+}
+
+@profiling.stage
+def parse_node(exp : ExperimentIndex, node : int, snapshots : bool = True) -> NodeChunk:
+    """
+    Rows of the node at position `node` of exp, built column by column: the
+    peers ids and cids of its logs are mapped (as whole arrays) by exp. Its
+    peers log is not read if `snapshots` is False (no snapshots rows).
+    """
+    dirname = exp.dirname
+    pid     = exp.pids[node]
+    dht     = exp.dhts[node]
 
-    def get_dht(self) -> DhtType:
-        return self.dht_type
+    # TODO: 
+    #  - add test that the provider is right and the type as well
 
-# look-ups, snapshots
-def parse_files(dirname : str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    if not os.path.isdir(dirname):
+    # columns (src_peer, src_dht, dst_peer, dst_dht,  snapshot_nr,  bucket_nr)
+    dst_pids, snap_nrs, bucket_nrs, sizes = [], [], [], []
+    filename = f'{dirname}/{pid}-peers.log' if snapshots else None
+    if filename is not None and not logpack.log_exists(filename):
+        # its other logs are written as it runs (see follow-logs in
+        # docker/start_experiment.sh), so it ran but was killed
+        log.warning("Node %s has no peers log, its snapshots are left out", pid)
+        filename = None
+    for snap_nr , snapshot in enumerate(load_snapshots(filename) if filename else []):
+        for bucket_nr, bucket in enumerate(snapshot):
+            dst_pids.extend(bucket)
+            snap_nrs.append(snap_nr)
+            bucket_nrs.append(bucket_nr)
+            sizes.append(len(bucket))
+
+    dst_codes = exp.pid_codes(dst_pids)
+    # TODO: I wonder why?
+    kept = ~exp.is_failed(dst_pids)
+    assert (dst_codes[kept] >= 0).all(), 'unknown peer in snapshot'
+    dst_codes = dst_codes[kept]
+    snapshot_columns = [
+        np.full(len(dst_codes), node, dtype=np.int32),
+        np.full(len(dst_codes), dht, dtype=np.int8),
+        dst_codes,
+        exp.node_dhts(dst_codes),
+        np.repeat(np.asarray(snap_nrs, dtype=np.int64), sizes)[kept],
+        np.repeat(np.asarray(bucket_nrs, dtype=np.int64), sizes)[kept],
+    ]
+
+    # columns (cid, src_pid, src_dht, queries_nr, time_ms, storage_node, storage_dht, timestamp),
+    # one row per storage node (or a single one without storage node)
+    pb_records  = load_provides_record(f'{dirname}/{pid}')
+    useless_cids = {record[0] for record in pb_records if len(record[3]) == 0}
+    rows_nr      = [max(len(record[3]), 1) for record in pb_records]
+    store_nodes  = [peer for record in pb_records for peer in (record[3] or [None])]
+
+    # my fault, I need to look a this
+    store_codes = exp.pid_codes(store_nodes)
+    assert all(
+        peer is None for peer in np.asarray(store_nodes, dtype=object)[store_codes < 0]
+    ), 'unknown storage node'
+
+    publishes = [
+        np.repeat(np.asarray([record[0] for record in pb_records], dtype=object), rows_nr),
+        np.full(len(store_codes), node, dtype=np.int32),
+        np.full(len(store_codes), dht, dtype=np.int8),
+        np.repeat(np.asarray([record[2] for record in pb_records], dtype=np.int64), rows_nr),
+        np.repeat(np.asarray([record[1] for record in pb_records], dtype=np.float64), rows_nr),
+        store_codes,
+        exp.node_dhts(store_codes),
+        np.repeat(np.asarray([record[4] for record in pb_records], dtype=np.int64), rows_nr),
+    ]
+
+    # columns (timestamp, pid, peer_dht, cid, cid_type, lookup_time, providers, queries)
+    times     = load_look_up_times(f'{dirname}/{pid}-lookup-times.log')
+    cid_codes = exp.cid_codes(times['cid'])
+    providers = np.asarray(times['providers'], dtype=np.int64)
+
+    # the node that was supposed to publish this CID failed
+    # TODO: think how to handle this
+    found = cid_codes >= 0
+    assert (providers[~found] == 0).all()
+
+    # Normal node CID that was published only on bootstrap nodes
+    # which means it cannot be resolved so its useless
+    # TODO: discuss this with J. Leitao (whether to discard useless_cids records)
+
+    cid_codes = cid_codes[found]
+    cid_types = exp.cid_dhts(cid_codes)
+    providers = providers[found]
+
+    rec_types = np.asarray(times['type'], dtype=object)[found]
+    checked   = (cid_types != DHT_CATEGORY.categories.get_loc(DhtType.DEFAULT.name)) & (rec_types != '')
+    assert (dht_codes(rec_types[checked]) == cid_types[checked]).all(), 'cid type mistaken'
+
+    assert (providers <= 1).all()
+    lookups = [
+        times['timestamp'][found],
+        np.full(len(cid_codes), node, dtype=np.int32),
+        np.full(len(cid_codes), dht, dtype=np.int8),
+        cid_codes,
+        cid_types,
+        np.asarray(times['time_ms'], dtype=np.float64)[found],
+        providers,
+        np.asarray(times['queries'], dtype=np.int64)[found],
+    ]
+
+    return NodeChunk(lookups, snapshot_columns, publishes, useless_cids)
+
+# experiment shared by the nodes parsed in a worker process
+_worker_exp : ExperimentIndex | None = None
+
+def _init_worker(exp : ExperimentIndex, json_backend : str, profile : bool, trace_memory : bool):
+    global _worker_exp
+    _worker_exp = exp
+    decoders.use_backend(json_backend)
+    if profile:
+        # the records are sent back with each chunk (never saved by the worker)
+        profiling.enable(report=None, trace_memory=trace_memory)
+        profiling.take_records()
+
+def _parse_node_task(node : int) -> NodeChunk:
+    assert _worker_exp is not None
+    chunk = parse_node(_worker_exp, node)
+    chunk.profile = profiling.take_records()
+    return chunk
+
+@profiling.stage
+def merge_columns(tables : list[Columns], columns : list[str], dht_columns : list[str]) -> pd.DataFrame:
+    merged = {
+        column : np.concatenate([table[i] for table in tables]) if len(tables) > 0 else np.empty(0)
+            for i, column in enumerate(columns)
+    }
+    for column in dht_columns:
+        merged[column] = pd.Categorical.from_codes(merged[column].astype(np.int8), dtype=DHT_CATEGORY)
+
+    return pd.DataFrame(merged)
+
+class ExperimentTables(NamedTuple):
+    lookups   : pd.DataFrame
+    snapshots : pd.DataFrame
+    publishes : pd.DataFrame
+    peers     : pd.DataFrame
+    cids      : pd.DataFrame
+
+@profiling.stage
+def encode_ids(exp : ExperimentIndex, lookups : pd.DataFrame, snapshots : pd.DataFrame, publishes : pd.DataFrame) -> ExperimentTables:
+    """
+    Builds the peers and cids tables of the experiment and replaces the cids
+    of the publishes by their (integer) index in the cids table (the peers
+    ids, and the cids of the look-ups, were already replaced by parse_node).
+    """
+    peers = pd.DataFrame({
+        pr.IDX  : np.arange(len(exp.pids), dtype=np.int32),
+        pr.PID  : exp.pids,
+        pr.DHT  : pd.Categorical.from_codes(exp.dhts, dtype=DHT_CATEGORY),
+        pr.ROLE : exp.roles,
+    })
+
+    # some published cids might not be in the cids log of their publisher
+    published = publishes[[pv.CID, pv.SRC_PID]].drop_duplicates(pv.CID)
+    missing   = published[exp.cid_codes(published[pv.CID]) < 0]
+
+    cids_idx = exp.cids.append(pd.Index(missing[pv.CID], dtype=object))
+    owners   = np.concatenate([exp.cids_owner, missing[pv.SRC_PID].to_numpy(np.int32)])
+    cids = pd.DataFrame({
+        cd.IDX   : np.arange(len(cids_idx), dtype=np.int32),
+        cd.CID   : cids_idx,
+        cd.OWNER : owners,
+        cd.TYPE  : pd.Categorical.from_codes(exp.node_dhts(owners), dtype=DHT_CATEGORY),
+    })
+
+    publishes[pv.CID] = cids_idx.get_indexer(publishes[pv.CID]).astype(np.int32)
+
+    return ExperimentTables(lookups, snapshots, publishes, peers, cids)
+
+def load_experiment(dirname : str) -> ExperimentIndex:
+    if not (os.path.isdir(dirname) or logpack.is_archive(dirname)):
         log.fatal("Error: path %s doesn't exists" % (dirname,))
         sys.exit(1)
 
     log.info("loading files from: %s", dirname)
 
-    # TODO: make this instance variables and split the code into methods
-    nodes        : dict[str, Node]    = {}
-    cids_type    : dict[str, DhtType] = {}
-    failed_nodes : set[str] = set()
-    useless_cids : set[str] = set()
-
-    resolved  = set()
-    published = set()
-
-    # TODO: add loading bar :)
-    # loads each node info (which is made of <node-id> and <dht-type> )
-    nodes_info = glob.glob('{}/*.info'.format(dirname))
-    for info_file in nodes_info:
-        info    = load_node_info(info_file)
-        peer_id = info['id']
-        node    = Node(peer_id, DhtType.parse_from(info['mode']))
-        nodes[node.get_pid()] = node
-
-        try:
-            cids = load_cids(f'{dirname}/{peer_id}-cids.log')
-            for cid in cids:
-                cids_type[cid] = node.get_dht()
-        except FileNotFoundError:
-            # log.warning("Node %s failed during experiment, removing it...", peer_id)
-            failed_nodes.add(peer_id)
-            del nodes[peer_id]
-
-        
-    # TODO: 
-    #  - add test that the provider is right and the type as well
-
-    # list of (src_peer, src_dht, dst_peer, dst_dht,  snapshot_nr,  bucket_nr)
-    snapshots = []
-    for node in nodes.values():
-        filename = f'{dirname}/{node.get_pid()}-peers.log'
-        for snap_nr , snapshot in enumerate(load_snapshots(filename)):
-            for bucket_nr, bucket in enumerate(snapshot):
-                for dst_pid in bucket:
-
-                    # TODO: I wonder why?
-                    if dst_pid in failed_nodes: continue
-
-                    dst_dht = nodes[dst_pid].get_dht().name
-                    src_dht = node.get_dht()
-                    snapshots.append(
-                        (node.get_pid(), src_dht.name,  dst_pid, dst_dht, snap_nr, bucket_nr)
-                    )
-                
-    storages = set()
-    # list of (cid, src_pid, src_dht, queries_nr, time_ms, storage_node, storage_dht)
-    publishes = []
-    for node in nodes.values():
-        pb_records  = load_provides_record(f'{dirname}/{node.get_pid()}')
-        # print(f'node: {node.get_pid()}, dht: {node.get_dht().name}')
-        # pp.pprint(pb_records)
-        for rec in pb_records:
-            published.add(rec['cid'])
-            # provs_info[]
-            store_nodes = rec.get('store_nodes')
-            if len(store_nodes) == 0:
-                useless_cids.add(rec['cid'])
-                publishes.append((
-                    rec['cid'], 
-                    node.get_pid(), 
-                    node.get_dht().name, 
-                    len(rec['queries']), 
-                    rec['time_ms'],
-                    None, None
-                ))
-            else:
-                for peer in rec['store_nodes']:
-                    # my fault, I need to look a this
-                    publishes.append((
-                        rec['cid'], 
-                        node.get_pid(), 
-                        node.get_dht().name, 
-                        len(rec['queries']), 
-                        rec['time_ms'],
-                        peer,
-                        # peer_id, 
-                        nodes[peer].get_dht().name
-                    ))
-                    storages.add(peer)
-                # if store_count == 0:
-                #     print(f'node: {node.get_pid()}, dht: {node.get_dht().name}')
-                #     print(store_count)
-                #     print('bootstraps')
-                #     pp.pprint(bootstraps)
-                #     print('record:')
-                #     pp.pprint(rec)
-                # assert store_count > 0 , 'you gotta do something'
-                # print(store_count)
-        # assert store_count == 0 or store_count == len(pb_records), 'something is quite wrong'
-
-    # list of (timestamp, pid, peer_dht, cid, cid_type, lookup_time, providers, queries)
-    lookups = []
-    # TODO: add loading bar :)
-    # loads all CID records
-    for node in nodes.values():
-        times = load_look_up_times(f'{dirname}/{node.get_pid()}-lookup-times.log')
-        for time_rec in times:
-            timestamp   = time_rec['timestamp']
-            cid         = time_rec['cid']
-            lookup_time = time_rec['time_ms']
-            providers   = len(time_rec['providers'])
-            c_type      = cids_type.get(cid)
-            queries     = len(time_rec['queries'])
-            # cid_type    = time_rec['type']
-            resolved.add(cid)
-
-            # the node that was supposed to publish this CID failed
-            if c_type == None:
-                # TODO: think how to handle this
-                # log.warn("Discaring record: %s", time_rec)
-                assert providers == 0 
-                continue
+    exp = ExperimentIndex(dirname)
+    exp.load_nodes()
+    return exp
 
-            # Normal node CID that was published only on bootstrap nodes
-            # which means it cannot be resolved so its useless
-            # if cid in useless_cids: # TODO: discuss this with J. Leitao
-            #     # log.warn("Discaring useless CID record: %s", time_rec)
-            #     continue
-
-
-            if c_type != DhtType.DEFAULT:
-                aux = time_rec['type']
-                assert aux == '' or c_type == DhtType.parse_from(aux), 'cid type mistaken'
-
-            assert providers <= 1
-            lookups.append(
-                (timestamp, node.get_pid(), node.get_dht().name, cid,
-                    c_type.name, lookup_time, providers, queries)
-            )
+# look-ups, snapshots
+@profiling.stage
+def parse_files(dirname : str, jobs : int = 1) -> ExperimentTables:
+    exp = load_experiment(dirname)
+
+    # each node's logs are parsed on their own and their chunks merged (in
+    # the nodes order) afterwards, so both paths output the same tables
+    if jobs > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(exp, decoders.backend, profiling.enabled, profiling.memory)
+        ) as pool:
+            chunks = list(pool.map(_parse_node_task, range(len(exp)), chunksize=8))
+        for chunk in chunks:
+            profiling.add_records(chunk.profile)
+    else:
+        chunks = [parse_node(exp, node) for node in range(len(exp))]
+
+    lookups   = merge_columns([chunk.lookups   for chunk in chunks], LOOKUPS_COLUMNS,   [lk.PEER_DHT, lk.CID_TYPE])
+    snapshots = merge_columns([chunk.snapshots for chunk in chunks], SNAPSHOTS_COLUMNS, [sp.SRC_DHT, sp.DST_DHT])
+    publishes = merge_columns([chunk.publishes for chunk in chunks], PUBLISHES_COLUMNS, [pv.SRC_DHT, pv.STORAGE_DHT])
+
+    useless_cids = set().union(*(chunk.useless_cids for chunk in chunks))
 
     # usesless_counts = {}
     # for cid in useless_cids:
@@ -311,14 +656,51 @@ def parse_files(dirname : str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame
 
     # print(usesless_counts)
     # TODO: add info about lookups
-    log.info("loaded: %d nodes, %d cids, %d look up records, %d snapshot records, %d publish records, %d failed nodes, %d useless cids", len(nodes), len(cids_type), len(lookups), len(snapshots), len(publishes), len(failed_nodes), len(useless_cids))
-    return pd.DataFrame(lookups, 
-            columns=np.array([lk.TS, lk.PID, lk.PEER_DHT, lk.CID, lk.CID_TYPE, lk.LOOKUP_TIME, lk.PROVIDERS, lk.QUERIES])
-           ), pd.DataFrame(snapshots,
-               columns=np.array([sp.SRC_PID, sp.SRC_DHT, sp.DST_PID, sp.DST_DHT, sp.SNAPSHOT_NR, sp.BUCKET_NR])
-           ), pd.DataFrame(publishes,
-                columns=np.array([pv.CID, pv.SRC_PID, pv.SRC_DHT, pv.QUERIES_NR, pv.DURATION, pv.STORAGE_NODE, pv.STORAGE_DHT])
-           )
+    log.info("loaded: %d nodes, %d cids, %d look up records, %d snapshot records, %d publish records, %d failed nodes, %d useless cids", len(exp.pids), len(exp.cids), len(lookups), len(snapshots), len(publishes), len(exp.failed), len(useless_cids))
+    return encode_ids(exp, lookups, snapshots, publishes)
+
+# nodes whose chunks are summarized at once (only their rows are ever in memory)
+SUMMARY_BATCH = 64
+
+def summarize_nodes(exp : ExperimentIndex, nodes : range) -> Summary:
+    # only the look-ups and publishes are summarized
+    chunks  = [parse_node(exp, node, snapshots=False) for node in nodes]
+    summary = Summary()
+    summary.add_lookups(merge_columns([chunk.lookups for chunk in chunks], LOOKUPS_COLUMNS, [lk.PEER_DHT, lk.CID_TYPE]))
+    summary.add_publishes(merge_columns([chunk.publishes for chunk in chunks], PUBLISHES_COLUMNS, [pv.SRC_DHT, pv.STORAGE_DHT]))
+    return summary
+
+def _summarize_nodes_task(nodes : range) -> tuple[Summary, list[profiling.StageRecord]]:
+    assert _worker_exp is not None
+    summary = summarize_nodes(_worker_exp, nodes)
+    return summary, profiling.take_records()
+
+@profiling.stage
+def summarize_files(dirname : str, jobs : int = 1) -> Summary:
+    """
+    Like parse_files, but the look-ups and publishes of every SUMMARY_BATCH
+    nodes are only added to a summary (see summary.py), so the tables of the
+    whole experiment are never built.
+    """
+    exp     = load_experiment(dirname)
+    batches = [range(start, min(start + SUMMARY_BATCH, len(exp))) for start in range(0, len(exp), SUMMARY_BATCH)]
+    summary = Summary()
+    if jobs > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(exp, decoders.backend, profiling.enabled, profiling.memory)
+        ) as pool:
+            for batch_summary, records in pool.map(_summarize_nodes_task, batches):
+                summary.merge(batch_summary)
+                profiling.add_records(records)
+    else:
+        for batch in batches:
+            summary.merge(summarize_nodes(exp, batch))
+
+    log.info(
+        "summarized: %d nodes, %d look up records, %d publishes, %d failed nodes",
+        len(exp.pids), summary.total('lookups'), summary.total('publishes'), len(exp.failed)
+    )
+    return summary
 
 
 # TODO: change this thing :)
@@ -331,48 +713,157 @@ def parse_files(dirname : str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame
 #     # return [f'../logs/ipfs-logs-{i}' for i in range(33, 39) ]
 #     return []
 
+def parse_experiment(dirname : str, opts : argparse.Namespace) -> ExperimentTables:
+    if opts.no_cache or not os.path.exists(dirname):
+        return parse_files(dirname, opts.jobs)
+
+    # the signature is taken before parsing, so changes made meanwhile
+    # are caught by the next run
+    signature = dir_signature(dirname)
+    tables    = load_cached(opts.cache_dir, dirname, signature)
+    if tables is None:
+        tables = parse_files(dirname, opts.jobs)
+        save_cached(opts.cache_dir, dirname, signature, tables)
+
+    return tables
+
+# name, index column and (parquet) types of the tables the parser saves (the
+# ExperimentTables ones and the rt cube)
+TABLES = [
+    ('lookups',   lk.PID,     LOOKUPS_TYPES),
+    ('snapshots', sp.SRC_PID, SNAPSHOTS_TYPES),
+    ('publishes', pv.SRC_PID, PUBLISHES_TYPES),
+    ('peers',     pr.IDX,     PEERS_TYPES),
+    ('cids',      cd.IDX,     CIDS_TYPES),
+    ('rt-cube',   rc.SRC_PID, RT_CUBE_TYPES),
+]
+
+def partition_file(name : str, exp_id : int | str) -> str:
+    # partitioned tables are a directory with a file per experiment
+    return f'{name}/exp-{exp_id}'
+
+def remove_partitions(name : str):
+    for ext in ['csv', 'parquet']:
+        for filename in glob.glob(f'{partition_file(name, "*")}.{ext}'):
+            os.remove(filename)
+
+def clear_partitions(name : str):
+    # the partitions of a previous run (which might have had more
+    # experiments) and the table file of a not partitioned one, which
+    # charts.py would never read otherwise
+    os.makedirs(name, exist_ok=True)
+    remove_partitions(name)
+    for ext in ['csv', 'parquet']:
+        if os.path.exists(f'{name}.{ext}'):
+            os.remove(f'{name}.{ext}')
+
+def clear_table_dir(name : str):
+    # the partitions of a partitioned run, which charts.py would read instead
+    # of the table file
+    if os.path.isdir(name):
+        remove_partitions(name)
+        if len(os.listdir(name)) == 0:
+            os.rmdir(name)
+        else:
+            log.warning("%s/ is not empty, charts.py will read it instead of the %s table file", name, name)
+
+@profiling.stage
+def write_table(data : pd.DataFrame, name : str, index : str, types : dict, fmt : str):
+    # the table in the other format (of a previous run) would be the one
+    # charts.py reads
+    for ext in ['csv', 'parquet']:
+        if ext != fmt and os.path.exists(f'{name}.{ext}'):
+            os.remove(f'{name}.{ext}')
+
+    if fmt == 'parquet':
+        # same columns order as the csv files (the index goes first)
+        columns = [index] + [col for col in data.columns if col != index]
+        data[columns].astype(types).to_parquet(f'{name}.parquet', index=False)
+    else:
+        data.set_index(index).to_csv(f'{name}.csv')
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Parses experiments logs into csv (or parquet) files.'
+    )
+    parser.add_argument(
+        'directories', nargs='+', metavar='directory',
+        help='experiment logs directory or archive (see logpack.py), its position is the experiment id'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help='number of processes used to parse the nodes logs (default: 1)'
+    )
+    parser.add_argument(
+        '-f', '--format', choices=['csv', 'parquet'], default='csv',
+        help='format of the generated tables, parquet needs pyarrow (default: csv)'
+    )
+    parser.add_argument(
+        '--cache-dir', default=CACHE_DIR, metavar='DIR',
+        help=f'directory where the parsed experiments are cached (default: {CACHE_DIR})'
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always parse every experiment (the cache is neither read nor updated)'
+    )
+    parser.add_argument(
+        '--json', choices=decoders.available_backends(), default=decoders.backend,
+        help=f'library used to decode the logs JSON records (default: {decoders.backend})'
+    )
+    parser.add_argument(
+        '--partitioned', action='store_true',
+        help='save each table as a directory with a file per experiment, written as soon as it is parsed'
+    )
+    parser.add_argument(
+        '--summary', nargs='?', const=SUMMARY_FILE, metavar='FILE',
+        help=f'only save a summary of the look-ups and publishes (counters and quantile sketches) to FILE instead of the tables, see summary.py (default: {SUMMARY_FILE})'
+    )
+    profiling.add_arguments(parser)
+    return parser.parse_args(args[1:])
+
 def main(args : list[str]):
-    if len(args) < 2:
-        print("Error no directory provided")
-        print(f"usage: {args[0]} directory...")
-        sys.exit(1)
-    
-    # files = parse_files(args[1:])
-    files = args[1:]
+    opts  = parse_args(args)
+    files = opts.directories
+    decoders.use_backend(opts.json)
+    profiling.enable_from(opts)
     
     log.basicConfig(level=log.INFO, format="%(levelname)s: %(message)s")
+
+    if opts.summary is not None:
+        summary = Summary()
+        for exp_id, experiment in enumerate(files):
+            summary.merge(summarize_files(experiment, opts.jobs).with_exp_id(exp_id))
+        summary.save(opts.summary)
+        return
     
-    lookups   = []
-    snapshots = []
-    publishes = []
+    if opts.partitioned:
+        for name, _, _ in TABLES:
+            clear_partitions(name)
+
+    # (not partitioned) every experiment tables, in the TABLES order
+    tables_parts : list[list[pd.DataFrame]] = [[] for _ in TABLES]
     for exp_id, experiment in enumerate(files):
-        lkups, snap, psh= parse_files(experiment)
-    
-        # set up experiment ids
-        lkups[hd.EXP_ID] = exp_id 
-        snap[hd.EXP_ID]  = exp_id
-        psh[hd.EXP_ID]   = exp_id
-    
-        # ...
-        lookups.append(lkups)
-        snapshots.append(snap)
-        publishes.append(psh)
+        tables = parse_experiment(experiment, opts)
     
-    pd.concat(
-        lookups, 
-        ignore_index=True
-    ).set_index(lk.PID).to_csv('lookups.csv')
-    
-    
-    pd.concat(
-        snapshots, 
-        ignore_index=True
-    ).set_index(sp.SRC_PID).to_csv('snapshots.csv')
-    
-    pd.concat(
-        publishes, 
-        ignore_index=True
-    ).set_index(pv.SRC_PID).to_csv('publishes.csv')
+        # set up experiment ids (peers and cids ids are unique per experiment)
+        for table in tables:
+            table[hd.EXP_ID] = exp_id
+
+        exp_tables = [*tables, calc_rt_cube(tables.snapshots)]
+        if opts.partitioned:
+            # written right away, so only one experiment is ever in memory
+            for (name, index, types), table in zip(TABLES, exp_tables):
+                write_table(table, partition_file(name, exp_id), index, types, opts.format)
+        else:
+            for parts, table in zip(tables_parts, exp_tables):
+                parts.append(table)
+
+        del tables, exp_tables
+
+    if not opts.partitioned:
+        for (name, index, types), parts in zip(TABLES, tables_parts):
+            clear_table_dir(name)
+            write_table(pd.concat(parts, ignore_index=True), name, index, types, opts.format)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,235 @@
+import argparse
+import atexit
+import cProfile
+import csv
+import functools
+import inspect
+import json
+import logging as log
+import os
+import resource
+import time
+import tracemalloc
+
+from collections.abc import Iterator
+from typing import Any, Callable, NamedTuple, TypeVar
+
+# Opt-in instrumentation of the parser and charts stages. Every function
+# decorated with @stage records (per call) its wall time and the rows it got
+# and produced. It is enabled with the --profile option of main.py and
+# charts.py or by setting PROFILE_ENV to the report file; the report (.json or
+# .csv) is saved at exit, with the totals of each stage. If CPROFILE_ENV (or
+# --cprofile) names a directory, a cProfile dump of every outermost stage call
+# is saved there as well. The peak of traced memory of each stage is only
+# recorded with --profile-memory (or PROFILE_MEMORY_ENV set), as tracemalloc
+# slows some stages many times more than others, so the times of such a
+# report are not comparable.
+
+PROFILE_ENV        = 'IPFS_TESTS_PROFILE'
+CPROFILE_ENV       = 'IPFS_TESTS_CPROFILE'
+PROFILE_MEMORY_ENV = 'IPFS_TESTS_PROFILE_MEMORY'
+
+PROFILE_REPORT = 'profile.json'
+
+class StageRecord(NamedTuple):
+    name     : str
+    seconds  : float
+    rows_in  : int
+    rows_out : int
+    peak_mb  : float # traced memory allocated on top of what there was at the start (0 if not traced)
+
+enabled = False
+memory  = False # whether the memory is traced
+
+_records     : list[StageRecord] = []
+_report      : str | None = None
+_cprofile    : str | None = None
+_owner       : int = 0       # only the process that enabled it saves cProfile dumps
+_stack       : list['_Frame'] = []
+_dumps_count : dict[str, int] = {}
+
+def count_rows(value : Any) -> int:
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return 0
+    if isinstance(value, tuple) and all(hasattr(item, 'shape') for item in value):
+        return sum(len(item) for item in value)   # e.g. ExperimentTables
+    if isinstance(value, dict):
+        first = next(iter(value.values()), None)  # e.g. LookupColumns
+        return len(first) if isinstance(first, list) else len(value)
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+class _Frame:
+    def __init__(self, name : str, dump : bool = True):
+        self.name = name
+        self.dump = dump
+        self.peak = 0
+        self.prof = None
+        self.base = 0
+
+    def __enter__(self) -> '_Frame':
+        if self.dump and _cprofile is not None and len(_stack) == 0 and os.getpid() == _owner:
+            self.prof = cProfile.Profile()
+            self.prof.enable()
+        if memory:
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.seconds = time.perf_counter() - self.start
+        _stack.pop()
+        self.peak_mb = 0.0
+        if memory:
+            # the peak of the stages called by this one was reset by them
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+            self.peak_mb = max(0, peak - self.base) / 2**20
+            if len(_stack) > 0:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+
+        if self.prof is not None:
+            self.prof.disable()
+            count = _dumps_count.get(self.name, 0)
+            _dumps_count[self.name] = count + 1
+            self.prof.dump_stats(f'{_cprofile}/{self.name}-{count}.prof')
+
+_END = object()
+
+def _iter_profiled(name : str, rows_in : int, items : Iterator) -> Iterator:
+    # only the time spent producing the items counts (not consuming them)
+    seconds, rows, peak_mb = 0.0, 0, 0.0
+    try:
+        while True:
+            with _Frame(name, dump=False) as frame:
+                item = next(items, _END)
+            seconds += frame.seconds
+            peak_mb  = max(peak_mb, frame.peak_mb)
+            if item is _END:
+                break
+            rows += 1
+            yield item
+    finally:
+        _records.append(StageRecord(name, seconds, rows_in, rows, peak_mb))
+
+F = TypeVar('F', bound=Callable)
+
+def stage(func : F) -> F:
+    """
+    Records every call of func while profiling is enabled (its results are
+    iterated over lazily if it is a generator function).
+    """
+    name      = func.__name__
+    generator = inspect.isgeneratorfunction(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+
+        rows_in = count_rows(args[0]) if len(args) > 0 else 0
+        if generator:
+            return _iter_profiled(name, rows_in, func(*args, **kwargs))
+
+        with _Frame(name) as frame:
+            result = func(*args, **kwargs)
+
+        _records.append(StageRecord(name, frame.seconds, rows_in, count_rows(result), frame.peak_mb))
+        return result
+
+    return wrapper # type: ignore
+
+def enable(report : str | None = PROFILE_REPORT, cprofile_dir : str | None = None, trace_memory : bool = False):
+    """
+    Starts recording the stages calls, the report is saved to `report` at
+    exit (nothing is saved if it is None, see take_records).
+    """
+    global enabled, memory, _report, _cprofile, _owner
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    memory = trace_memory
+
+    if report is not None and _report is None:
+        atexit.register(save_report)
+    if cprofile_dir is not None:
+        os.makedirs(cprofile_dir, exist_ok=True)
+
+    enabled, _report, _cprofile, _owner = True, report, cprofile_dir, os.getpid()
+
+def add_arguments(parser : argparse.ArgumentParser):
+    parser.add_argument(
+        '--profile', nargs='?', const=PROFILE_REPORT, metavar='REPORT',
+        help=f'save the time and rows of each stage to REPORT, a .json or .csv file (default: {PROFILE_REPORT})'
+    )
+    parser.add_argument(
+        '--profile-memory', action='store_true',
+        help='also trace the peak memory of each stage, which makes the stages much (and unevenly) slower (implies --profile)'
+    )
+    parser.add_argument(
+        '--cprofile', metavar='DIR',
+        help='save a cProfile dump of each outermost stage call to DIR (implies --profile)'
+    )
+
+def enable_from(opts : argparse.Namespace):
+    if opts.profile is not None or opts.cprofile is not None or opts.profile_memory:
+        enable(opts.profile or PROFILE_REPORT, opts.cprofile, opts.profile_memory)
+
+def take_records() -> list[StageRecord]:
+    """
+    Removes and returns the records taken so far (used to send the records
+    of a worker process to the parent).
+    """
+    records = _records[:]
+    _records.clear()
+    return records
+
+def add_records(records : list[StageRecord]):
+    _records.extend(records)
+
+def summary() -> list[dict]:
+    """
+    Totals of each stage (in the order they were first called).
+    """
+    stages : dict[str, dict] = {}
+    for rec in _records:
+        total = stages.setdefault(rec.name, {
+            'stage' : rec.name, 'calls' : 0, 'seconds' : 0.0, 'rows_in' : 0, 'rows_out' : 0, 'peak_mb' : 0.0
+        })
+        total['calls']    += 1
+        total['seconds']  += rec.seconds
+        total['rows_in']  += rec.rows_in
+        total['rows_out'] += rec.rows_out
+        total['peak_mb']   = max(total['peak_mb'], rec.peak_mb)
+
+    for total in stages.values():
+        rows = max(total['rows_in'], total['rows_out'])
+        total['rows_per_s'] = round(rows / total['seconds']) if total['seconds'] > 0 else 0
+        total['seconds']    = round(total['seconds'], 6)
+        total['peak_mb']    = round(total['peak_mb'], 3)
+
+    return list(stages.values())
+
+def save_report(filename : str | None = None):
+    filename = filename if filename is not None else _report
+    if filename is None or len(_records) == 0:
+        return
+
+    stages = summary()
+    if filename.endswith('.csv'):
+        with open(filename, 'w', newline='') as file:
+            out = csv.DictWriter(file, fieldnames=list(stages[0].keys()))
+            out.writeheader()
+            out.writerows(stages)
+    else:
+        # ru_maxrss is in KiB on linux
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        with open(filename, 'w') as file:
+            json.dump({'peak_rss_mb' : rss_mb, 'stages' : stages}, file, indent=2)
+
+    log.info("profile report saved to %s", filename)
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV], os.environ.get(CPROFILE_ENV) or None, bool(os.environ.get(PROFILE_MEMORY_ENV)))
@@ -0,0 +1,17 @@
+import pandas as pd
+
+import profiling
+from utils import RtCube as rc
+
+# The routing tables composition cube: the number of peers of each dht version
+# (dst-dht) in every bucket of every routing table snapshot of the experiments.
+# It has one row per (non empty) cell, so it is much smaller than the
+# snapshots table (one row per peer) and has all the routing table charts need.
+RT_CUBE_DIMS = [rc.EXP_ID, rc.SRC_DHT, rc.SRC_PID, rc.SNAPSHOT_NR, rc.BUCKET_NR, rc.DST_DHT]
+
+@profiling.stage
+def calc_rt_cube(snapshots : pd.DataFrame) -> pd.DataFrame:
+    """
+    The cube of a snapshots table (with the columns of utils.Snapshots).
+    """
+    return snapshots.groupby(RT_CUBE_DIMS, observed=True).size().rename(rc.COUNT).reset_index()
@@ -0,0 +1,164 @@
+import math
+
+import numpy as np
+
+from typing import Any
+
+# Mergeable quantiles sketch in the style of DDSketch (Masson et al., "DDSketch:
+# a fast and fully-mergeable quantile sketch with relative-error guarantees",
+# VLDB 2019). Values are counted in buckets whose bounds grow geometrically,
+# bucket k holding the values in (gamma^(k-1), gamma^k], so every quantile is
+# known up to a relative error of alpha whatever the number of values, and the
+# sketches of several experiments (or nodes) merge exactly by adding their
+# buckets counts.
+
+DEFAULT_ALPHA = 0.01
+
+# values below it (e.g. 0 ms latencies) are counted apart, as zeros
+MIN_VALUE = 1e-9
+
+class DDSketch:
+    def __init__(self, alpha : float = DEFAULT_ALPHA):
+        self.alpha  = alpha
+        self.gamma  = (1 + alpha) / (1 - alpha)
+        self.offset = 0                            # key of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zeros  = 0
+        self.count  = 0
+        self.sum    = 0.0
+        self.min    = math.inf
+        self.max    = -math.inf
+
+    def key(self, values : np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64)
+
+    def value(self, keys : np.ndarray) -> np.ndarray:
+        # the one with the same relative error to both bounds of the bucket
+        return 2 * self.gamma ** keys / (self.gamma + 1)
+
+    def _grow(self, low : int, high : int):
+        # makes room for the keys from low to high
+        if len(self.counts) == 0:
+            self.offset, self.counts = low, np.zeros(high - low + 1, dtype=np.int64)
+            return
+        start = min(low, self.offset)
+        end   = max(high, self.offset + len(self.counts) - 1)
+        if start == self.offset and end == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(end - start + 1, dtype=np.int64)
+        counts[self.offset - start : self.offset - start + len(self.counts)] = self.counts
+        self.offset, self.counts = start, counts
+
+    def add(self, values) -> 'DDSketch':
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.sum   += float(values.sum())
+        self.min    = min(self.min, float(values.min()))
+        self.max    = max(self.max, float(values.max()))
+
+        positive    = values[values >= MIN_VALUE]
+        self.zeros += len(values) - len(positive)
+        if len(positive) > 0:
+            keys = self.key(positive)
+            self._grow(int(keys.min()), int(keys.max()))
+            self.counts += np.bincount(keys - self.offset, minlength=len(self.counts))
+        return self
+
+    def merge(self, other : 'DDSketch') -> 'DDSketch':
+        assert self.gamma == other.gamma, 'sketches of different accuracy'
+        if len(other.counts) > 0:
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start : start + len(other.counts)] += other.counts
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum   += other.sum
+        self.min    = min(self.min, other.min)
+        self.max    = max(self.max, other.max)
+        return self
+
+    def __len__(self) -> int:
+        return self.count
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count > 0 else math.nan
+
+    def quantiles(self, qs : list[float]) -> np.ndarray:
+        """
+        Estimate of each quantile (within alpha of the real one), they are
+        clamped to the minimum and maximum values seen.
+        """
+        if self.count == 0:
+            return np.full(len(qs), math.nan)
+
+        ranks   = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        buckets = np.searchsorted(np.cumsum(self.counts) + self.zeros, ranks, side='right')
+        values  = np.where(
+            ranks < self.zeros, 0.0, self.value(np.minimum(buckets, len(self.counts) - 1) + self.offset)
+        ) if len(self.counts) > 0 else np.zeros(len(ranks))
+        return np.clip(values, self.min, self.max)
+
+    def quantile(self, q : float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Empirical CDF: the upper bound of each non empty bucket (0 for the
+        zeros) and the fraction of the values up to it.
+        """
+        keys    = np.flatnonzero(self.counts)
+        bounds  = self.gamma ** (keys + self.offset)
+        counts  = self.counts[keys]
+        if self.zeros > 0:
+            bounds, counts = np.concatenate([[0.0], bounds]), np.concatenate([[self.zeros], counts])
+        return bounds, np.cumsum(counts) / max(self.count, 1)
+
+    def histogram(self, bins_per_decade : int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Counts of the values in log spaced bins (`bins_per_decade` of them
+        for every power of 10) and the edges of the bins. The zeros are left
+        out. Each bucket is counted in the bin of its representative value.
+        """
+        keys = np.flatnonzero(self.counts)
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        bins   = np.floor(np.log10(self.value(keys + self.offset)) * bins_per_decade).astype(np.int64)
+        first  = bins.min()
+        counts = np.bincount(bins - first, weights=self.counts[keys]).astype(np.int64)
+        edges  = 10.0 ** (np.arange(first, first + len(counts) + 1) / bins_per_decade)
+        return counts, edges
+
+    def to_dict(self) -> dict[str, Any]:
+        # only the non empty buckets (keys relative to the offset)
+        keys = np.flatnonzero(self.counts)
+        return {
+            'alpha'  : self.alpha,
+            'offset' : self.offset,
+            'keys'   : keys.tolist(),
+            'counts' : self.counts[keys].tolist(),
+            'zeros'  : self.zeros,
+            'count'  : self.count,
+            'sum'    : self.sum,
+            'min'    : self.min if self.count > 0 else None,
+            'max'    : self.max if self.count > 0 else None,
+        }
+
+    @staticmethod
+    def from_dict(data : dict[str, Any]) -> 'DDSketch':
+        sketch = DDSketch(data['alpha'])
+        keys   = np.asarray(data['keys'], dtype=np.int64)
+        if len(keys) > 0:
+            sketch.offset = data['offset']
+            sketch.counts = np.zeros(keys.max() + 1, dtype=np.int64)
+            sketch.counts[keys] = data['counts']
+        sketch.zeros = data['zeros']
+        sketch.count = data['count']
+        sketch.sum   = data['sum']
+        sketch.min   = data['min'] if data['min'] is not None else math.inf
+        sketch.max   = data['max'] if data['max'] is not None else -math.inf
+        return sketch
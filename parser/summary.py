@@ -0,0 +1,195 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+import profiling
+from latency import calc_latency_quantiles, regroup_sketches, QUANTILES
+from sketch import DDSketch, DEFAULT_ALPHA
+from utils import Headers as hd
+from utils import Lookups as lk
+from utils import Publishes as pv
+
+from typing import Any
+
+# Compact, mergeable summary of the look-ups and publishes of the experiments
+# (see the --summary option of main.py): for each group of operations, keyed
+# by (experiment, peer dht, cid type), exact counters and a sketch (see
+# sketch.py) of each latency and queries metric. The summaries of different
+# nodes, experiments or runs merge exactly for the counters and within the
+# sketches relative error for the quantiles.
+
+SUMMARY_FILE    = 'summary.json'
+SUMMARY_VERSION = 1
+SUMMARY_KEYS    = [hd.EXP_ID, lk.PEER_DHT, lk.CID_TYPE]
+
+# the resolve time only of the resolved look-ups (like the latency charts),
+# the queries of every look-up; a publish's CID type is its publisher's dht
+LOOKUP_TIME     = 'lookup-time'
+LOOKUP_QUERIES  = 'lookup-queries'
+PUBLISH_TIME    = 'publish-time'
+PUBLISH_QUERIES = 'publish-queries'
+
+class Summary:
+    def __init__(self, alpha : float = DEFAULT_ALPHA):
+        self.alpha    = alpha
+        # by group (its SUMMARY_KEYS values, the experiment id is left out
+        # until the summary is given one, see with_exp_id)
+        self.counters : dict[tuple, dict[str, int]]      = {}
+        self.sketches : dict[tuple, dict[str, DDSketch]] = {}
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def _add(self, key : tuple, counters : dict[str, int], values : dict[str, Any]):
+        group_counters = self.counters.setdefault(key, {})
+        for name, count in counters.items():
+            group_counters[name] = group_counters.get(name, 0) + int(count)
+
+        group_sketches = self.sketches.setdefault(key, {})
+        for metric, metric_values in values.items():
+            group_sketches.setdefault(metric, DDSketch(self.alpha)).add(metric_values)
+
+    def add_lookups(self, lookups : pd.DataFrame):
+        for key, group in lookups.groupby([lk.PEER_DHT, lk.CID_TYPE], observed=True):
+            resolved = group[lk.PROVIDERS] > 0
+            self._add(key, {
+                'lookups'        : len(group),
+                'resolved'       : resolved.sum(),
+                'lookup-queries' : group[lk.QUERIES].sum(),
+            }, {
+                LOOKUP_TIME    : group.loc[resolved, lk.LOOKUP_TIME].to_numpy(),
+                LOOKUP_QUERIES : group[lk.QUERIES].to_numpy(),
+            })
+
+    def add_publishes(self, publishes : pd.DataFrame):
+        # one row per storage node of each publish
+        stored    = publishes[publishes[pv.STORAGE_NODE] >= 0]
+        storage   = stored.groupby(pv.SRC_DHT, observed=True).size()
+        publishes = publishes.drop_duplicates([pv.SRC_PID, pv.CID])
+        for dht, group in publishes.groupby(pv.SRC_DHT, observed=True):
+            self._add((dht, dht), {
+                'publishes'       : len(group),
+                'storage-nodes'   : storage.get(dht, 0),
+                'publish-queries' : group[pv.QUERIES_NR].sum(),
+            }, {
+                PUBLISH_TIME    : group[pv.DURATION].to_numpy(),
+                PUBLISH_QUERIES : group[pv.QUERIES_NR].to_numpy(),
+            })
+
+    def merge(self, other : 'Summary') -> 'Summary':
+        for key, counters in other.counters.items():
+            self._add(key, counters, {})
+        for key, sketches in other.sketches.items():
+            group_sketches = self.sketches.setdefault(key, {})
+            for metric, sketch in sketches.items():
+                group_sketches.setdefault(metric, DDSketch(sketch.alpha)).merge(sketch)
+        return self
+
+    def with_exp_id(self, exp_id : int) -> 'Summary':
+        """ The same summary with its groups keyed by exp_id as well. """
+        summary = Summary(self.alpha)
+        summary.counters = {(exp_id, *key) : counters for key, counters in self.counters.items()}
+        summary.sketches = {(exp_id, *key) : sketches for key, sketches in self.sketches.items()}
+        return summary
+
+    def total(self, counter : str) -> int:
+        return sum(counters.get(counter, 0) for counters in self.counters.values())
+
+    def counts(self) -> pd.DataFrame:
+        """ The counters of each group, indexed by SUMMARY_KEYS. """
+        rows  = [{**dict(zip(SUMMARY_KEYS, key)), **counters} for key, counters in sorted(self.counters.items())]
+        table = pd.DataFrame(rows) if len(rows) > 0 else pd.DataFrame(columns=SUMMARY_KEYS)
+        # the look-ups groups have no publishes counters (and vice versa)
+        return table.set_index(SUMMARY_KEYS).fillna(0).astype('int64')
+
+    def quantiles(self, metric : str, by : list[str] = SUMMARY_KEYS, quantiles : list[float] = QUANTILES) -> pd.DataFrame:
+        """
+        Count, mean and quantiles of a metric by the `by` keys (the groups
+        with the same values of them are merged, e.g. the experiments).
+        """
+        sketches = {key : sketches[metric] for key, sketches in self.sketches.items() if metric in sketches}
+        return calc_latency_quantiles(regroup_sketches(sketches, SUMMARY_KEYS, by), by, quantiles)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'version' : SUMMARY_VERSION,
+            'alpha'   : self.alpha,
+            'keys'    : SUMMARY_KEYS,
+            'groups'  : [
+                {
+                    'key'      : list(key),
+                    'counters' : counters,
+                    'sketches' : {metric : sketch.to_dict() for metric, sketch in self.sketches.get(key, {}).items()},
+                } for key, counters in sorted(self.counters.items())
+            ]
+        }
+
+    @staticmethod
+    def from_dict(data : dict[str, Any]) -> 'Summary':
+        assert data['version'] == SUMMARY_VERSION, f'unsupported summary version {data["version"]}'
+        summary = Summary(data['alpha'])
+        for group in data['groups']:
+            key = tuple(group['key'])
+            summary.counters[key] = dict(group['counters'])
+            summary.sketches[key] = {
+                metric : DDSketch.from_dict(sketch) for metric, sketch in group['sketches'].items()
+            }
+        return summary
+
+    @profiling.stage
+    def save(self, filename : str):
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, separators=(',', ':'))
+
+    @staticmethod
+    def load(filename : str) -> 'Summary':
+        with open(filename) as file:
+            return Summary.from_dict(json.load(file))
+
+def merge_files(filenames : list[str]) -> Summary:
+    """
+    Merges the summaries of different parser runs, the experiments of each
+    one are numbered after the ones of the previous files.
+    """
+    merged = Summary()
+    offset = 0
+    for filename in filenames:
+        summary = Summary.load(filename)
+        shifted = Summary(summary.alpha)
+        shifted.counters = {(offset + key[0], *key[1:]) : value for key, value in summary.counters.items()}
+        shifted.sketches = {(offset + key[0], *key[1:]) : value for key, value in summary.sketches.items()}
+        merged.merge(shifted)
+        offset += max((key[0] + 1 for key in summary.counters), default=0)
+    return merged
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Shows (and merges) the summaries saved by main.py --summary.'
+    )
+    parser.add_argument('summaries', nargs='+', metavar='summary', help='summary file')
+    parser.add_argument(
+        '--by', default=f'{lk.PEER_DHT},{lk.CID_TYPE}',
+        help=f'comma separated keys the groups are merged by (default: {lk.PEER_DHT},{lk.CID_TYPE})'
+    )
+    parser.add_argument('-o', '--output', metavar='FILE', help='save the merged summary to FILE')
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    opts = parse_args(args)
+    by   = [key.strip() for key in opts.by.split(',')]
+
+    summary = merge_files(opts.summaries)
+    if opts.output:
+        summary.save(opts.output)
+
+    print(summary.counts().groupby(level=by).sum().to_string(), end='\n\n')
+    for metric in [LOOKUP_TIME, PUBLISH_TIME, LOOKUP_QUERIES, PUBLISH_QUERIES]:
+        print(metric)
+        print(summary.quantiles(metric, by).round(2).to_string(), end='\n\n')
+
+if __name__ == '__main__':
+    main(sys.argv)
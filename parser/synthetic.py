@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+
+from datetime import datetime as dt, timedelta
+
+from main import DATE_TIME_FMT, SNAP_START, SNAP_END
+
+# Generator of synthetic experiment directories, with the same files (and
+# formats) as the ones saved by docker/start_experiment.sh, so that the parser
+# and the charts can be run (and timed) without a real experiment.
+
+# start time of every synthetic experiment
+START_TIME = dt(2023, 8, 1, 12, 0, 0)
+
+# the first snapshots are taken before the nodes connect to each other
+EMPTY_SNAPSHOTS = 3
+
+# base58 alphabet (used for the fake peers ids)
+B58_CHARS = ''.join(
+    c for c in string.digits + string.ascii_letters if c not in '0OIl'
+)
+
+def random_pid(rng : random.Random) -> str:
+    return '12D3KooW' + ''.join(rng.choices(B58_CHARS, k=44))
+
+def random_cid(rng : random.Random) -> str:
+    return 'bafkrei' + ''.join(rng.choices(string.ascii_lowercase + '234567', k=52))
+
+def go_log_time(time : dt) -> str:
+    # format of go's log package (see main.DATE_TIME_FMT)
+    return time.strftime(DATE_TIME_FMT)
+
+def daemon_log_time(time : dt) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def write_snapshot(file, time : dt, buckets : list[list[str]]):
+    file.write(f'{daemon_log_time(time)}\tINFO\tdht\t{SNAP_START}\n')
+    for nr, bucket in enumerate(buckets):
+        file.write(f'bucket: {nr}\n')
+        file.writelines(f'peer: {pid} last-useful: 0s\n' for pid in bucket)
+    file.write(f'{SNAP_END}\n')
+
+def write_daemon_noise(file, time : dt, rng : random.Random, peers : list[str]):
+    # it has quotes on purpose (no snapshot has them)
+    file.write(
+        f'{daemon_log_time(time)}\tWARN\tswarm\tfailed to dial "{rng.choice(peers)}": context deadline exceeded\n'
+    )
+
+def generate_experiment(
+        dirname          : str,
+        nodes            : int   = 600,
+        cids_per_node    : int   = 20,
+        snapshots        : int   = 40,
+        bucket_size      : int   = 10,
+        duration         : int   = 30 * 60,
+        resolve_interval : int   = 10,
+        kind             : str   = 'upgradable',
+        failed           : float = 0.0,
+        seed             : int   = 0,
+    ):
+    """
+    Writes the logs of a synthetic experiment of `kind` 'default' (only
+    default nodes) or 'upgradable' (half secure, half normal nodes) to
+    dirname. Each node publishes `cids_per_node` CIDs, takes a snapshot
+    of its routing table every minute (`snapshots` of them, with buckets of
+    up to `bucket_size` peers) and resolves a random CID every
+    `resolve_interval` seconds until `duration` seconds. A `failed`
+    fraction of the nodes only leaves its .info file behind.
+    """
+    rng = random.Random(seed)
+    os.makedirs(dirname, exist_ok=True)
+
+    modes = ['default'] if kind == 'default' else ['normal', 'secure']
+    pids  = [random_pid(rng) for _ in range(nodes)]
+    mode  = {pid : modes[i % len(modes)] for i, pid in enumerate(pids)}
+    alive = [pid for pid in pids if rng.random() >= failed]
+
+    owned = {pid : [random_cid(rng) for _ in range(cids_per_node)] for pid in alive}
+    cids  = [(cid, pid) for pid in alive for cid in owned[pid]]
+
+    buckets_nr = max(1, min(nodes.bit_length(), 20))
+
+    for pid in pids:
+        with open(f'{dirname}/{pid}.info', 'w') as file:
+            file.write(json.dumps({'id' : pid, 'mode' : mode[pid], 'role' : 'worker'}) + ' \n')
+
+    for pid in alive:
+        with open(f'{dirname}/{pid}-cids.log', 'w') as file:
+            file.write(f'{go_log_time(START_TIME)} {json.dumps(owned[pid])}\n')
+
+        with open(f'{dirname}/{pid}-peers.log', 'w') as file:
+            for nr in range(snapshots):
+                time = START_TIME + timedelta(minutes=nr)
+                write_daemon_noise(file, time, rng, pids)
+                buckets = [] if nr < EMPTY_SNAPSHOTS else [
+                    rng.sample(pids, rng.randint(0, min(bucket_size, nodes)))
+                        for _ in range(rng.randint(1, buckets_nr))
+                ]
+                write_snapshot(file, time, buckets)
+
+        with open(f'{dirname}/{pid}-publish.log', 'w') as file:
+            for i, cid in enumerate(owned[pid]):
+                time = START_TIME + timedelta(seconds=i)
+                file.write(f'{go_log_time(time)} ' + json.dumps({
+                    'cid'         : cid,
+                    'time_ms'     : rng.uniform(100, 5000),
+                    'providers'   : [],
+                    'queries'     : rng.sample(pids, rng.randint(1, min(20, nodes))),
+                    'store_nodes' : rng.sample(alive, rng.randint(0, min(bucket_size, len(alive)))),
+                }) + '\n')
+
+        with open(f'{dirname}/{pid}-lookup-times.log', 'w') as file:
+            for second in range(0, duration, resolve_interval):
+                time     = START_TIME + timedelta(seconds=second)
+                cid, src = rng.choice(cids)
+                found    = rng.random() < 0.9
+                file.write(f'{go_log_time(time)} ' + json.dumps({
+                    'cid'       : cid,
+                    'time_ms'   : rng.uniform(50, 10000),
+                    'type'      : mode[src] if mode[src] != 'default' else '',
+                    'providers' : [src] if found else [],
+                    'queries'   : rng.sample(pids, rng.randint(1, min(20, nodes))),
+                }) + '\n')
+
+def parse_args(args : list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=args[0], description='Generates the logs of a synthetic experiment.'
+    )
+    parser.add_argument('directory', help='where the logs are saved')
+    parser.add_argument('-n', '--nodes', type=int, default=600)
+    parser.add_argument('-c', '--cids', type=int, default=20, help='cids per node')
+    parser.add_argument('-s', '--snapshots', type=int, default=40)
+    parser.add_argument('-b', '--bucket-size', type=int, default=10)
+    parser.add_argument('-d', '--duration', type=int, default=30 * 60, help='in seconds')
+    parser.add_argument('-r', '--resolve-interval', type=int, default=10, help='in seconds')
+    parser.add_argument('-k', '--kind', choices=['default', 'upgradable'], default='upgradable')
+    parser.add_argument('-f', '--failed', type=float, default=0.0, help='fraction of failed nodes')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(args[1:])
+
+def main(args : list[str]):
+    opts = parse_args(args)
+    generate_experiment(
+        opts.directory, opts.nodes, opts.cids, opts.snapshots, opts.bucket_size,
+        opts.duration, opts.resolve_interval, opts.kind, opts.failed, opts.seed
+    )
+
+if __name__ == '__main__':
+    main(sys.argv)
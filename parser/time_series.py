@@ -0,0 +1,62 @@
+import pandas as pd
+
+import profiling
+from utils import Headers as hd
+
+# Time series of the look-ups and publishes tables: the operations (rows) of
+# each group of nodes in every time bin of the experiments and the percentiles
+# of their latency. The bins are `bin_width` seconds wide and counted from the
+# first bin of each experiment, so experiments that ran at different times
+# are overlapped.
+
+BIN_WIDTH   = 60
+PERCENTILES = [50, 90, 99]
+
+# index level of the time bins (their time since the start, in minutes)
+TIME  = 'time (minutes)'
+# mean number of operations of a bin (over the experiments that have any)
+COUNT = 'counts'
+
+def percentile_column(percentile : float) -> str:
+    return f'p{percentile:g}'
+
+def time_bins(times : pd.Series, exp_ids : pd.Series, bin_width : int = BIN_WIDTH) -> pd.Series:
+    """
+    Bin (the nearest one) of each time, counted from the first bin of its
+    experiment.
+    """
+    bins = (times / bin_width).round(0)
+    return bins - bins.groupby(exp_ids).transform('min')
+
+@profiling.stage
+def calc_time_series(
+        data        : pd.DataFrame,
+        time        : str,
+        latency     : str,
+        group       : str,
+        bin_width   : int = BIN_WIDTH,
+        percentiles : list[float] = PERCENTILES
+    ) -> pd.DataFrame:
+    """
+    Indexed by (group, TIME), the COUNT of operations of each bin and the
+    percentiles of their `latency` (of the operations of every experiment).
+    The `time` column must be in seconds.
+    """
+    minutes = time_bins(data[time], data[hd.EXP_ID], bin_width) * bin_width / 60
+    keys    = [data[group], minutes.rename(TIME)]
+
+    counts = data.groupby([*keys, data[hd.EXP_ID]], observed=True).size()
+    series = counts.groupby(level=[0, 1]).mean().to_frame(COUNT)
+
+    latencies = data[latency].groupby(keys, observed=True)
+    for percentile in percentiles:
+        series[percentile_column(percentile)] = latencies.quantile(percentile / 100)
+
+    return series
+
+def pivot_time_series(series : pd.DataFrame, column : str = COUNT) -> pd.DataFrame:
+    """
+    A column of the time series with one column per group (indexed by TIME),
+    the bins without operations of a group are 0.
+    """
+    return series[column].unstack(level=0).fillna(0)
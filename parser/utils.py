@@ -28,3 +28,34 @@ class Publishes(Headers):
     DURATION     = 'duration-time (ms)' 
     STORAGE_NODE = 'storage-node'
     STORAGE_DHT  = 'storage-dht'
+    TS           = 'timestamp (seconds)'
+
+
+# side tables of the (integer) peers and cids ids used by the others
+class Peers(Headers):
+    IDX  = 'idx'
+    PID  = 'pid'
+    DHT  = 'dht'
+    ROLE = 'role'
+
+class Cids(Headers):
+    IDX   = 'idx'
+    CID   = 'cid'
+    OWNER = 'owner' # idx of the peer that published it
+    TYPE  = 'cid-type'
+
+# headers of the graph metrics table (calculated by charts.py)
+class GraphMetrics(Headers):
+    EXPERIMENT  = 'experiment'
+    SNAPSHOT_NR = 'snapshot-nr'
+    METRIC      = 'metric'
+    VALUE       = 'value'
+
+# headers of the routing tables composition cube (see rt_cube.py)
+class RtCube(Headers):
+    SRC_DHT     = 'src-dht'
+    SRC_PID     = 'src-pid'
+    SNAPSHOT_NR = 'snapshot-nr'
+    BUCKET_NR   = 'bucket-nr'
+    DST_DHT     = 'dst-dht'
+    COUNT       = 'peers-nr'
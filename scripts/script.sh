@@ -173,12 +173,14 @@ function get-logs () {
 
     local count=$(ls "$OUT_LOGS" | wc -l | xargs)
 
-    local dst_log_dir="$OUT_LOGS/ipfs-logs"
-    [ $count -gt 0 ] && dst_log_dir="$dst_log_dir-$count"
+    local dst_log_file="$OUT_LOGS/ipfs-logs"
+    [ $count -gt 0 ] && dst_log_file="$dst_log_file-$count"
+    dst_log_file="$dst_log_file.logpack"
 
-    cp -r "$SHARED_LOG_DIR" "$dst_log_dir"
+    # a single compressed archive, which the parser reads as it is
+    parser/logpack.py pack "$SHARED_LOG_DIR" "$dst_log_file" --jobs "$(nproc)"
 
-    echo -e "\nLogs saved in: $dst_log_dir\n"
+    echo -e "\nLogs saved in: $dst_log_file\n"
 }
 
 # run main function
@@ -239,7 +241,7 @@ The commands are:
             creates a swarm, sets images in nodes or both
     init --cids, --repos
             generates cids, repos or both (if no option is given)
-    logs    clear and save logs in the ${bold}LOG_DIR/ipfs-log-{${normal}count${bold}}${normal} dir
+    logs    clear and save logs in the ${bold}LOG_DIR/ipfs-logs-{${normal}count${bold}}.logpack${normal} archive
     clean   clear logs without saving them
     help    displays the usage 
 "